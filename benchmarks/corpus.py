@@ -0,0 +1,149 @@
+import os
+import random
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+KINDS = ("blood", "urine", "imaging", "pathology")
+
+BLOOD_TESTS = [
+    ("Hemoglobin", "g/dL", 12.0, 16.0),
+    ("WBC Count", "10^3/uL", 4.0, 11.0),
+    ("RBC Count", "10^6/uL", 4.2, 5.9),
+    ("Platelet Count", "10^3/uL", 150, 450),
+    ("Hematocrit", "%", 36, 48),
+    ("Glucose", "mg/dL", 70, 100),
+    ("Cholesterol", "mg/dL", 125, 200),
+    ("HDL", "mg/dL", 40, 60),
+    ("LDL", "mg/dL", 50, 130),
+    ("Triglycerides", "mg/dL", 50, 150),
+    ("Creatinine", "mg/dL", 0.6, 1.3),
+    ("Urea", "mg/dL", 15, 40),
+    ("Sodium", "mmol/L", 135, 145),
+    ("Potassium", "mmol/L", 3.5, 5.1),
+    ("ALT", "U/L", 7, 56),
+    ("AST", "U/L", 10, 40),
+]
+URINE_TESTS = [
+    ("Color", ["Pale Yellow", "Yellow", "Dark Yellow"], "", ""),
+    ("Appearance", ["Clear", "Hazy", "Turbid"], "", ""),
+    ("pH", None, "", "4.5-8.0"),
+    ("Specific Gravity", None, "", "1.005-1.030"),
+    ("Protein", ["Negative", "Trace", "1+"], "", ""),
+    ("Glucose", ["Negative", "Trace"], "", ""),
+    ("Ketones", ["Negative", "Trace"], "", ""),
+    ("Pus Cells", None, "/hpf", "0-5"),
+    ("RBC", None, "/hpf", "0-2"),
+    ("Bacteria", ["Nil", "Few", "Many"], "", ""),
+]
+FIRST_NAMES = ["Asha", "Rahul", "Meera", "John", "Fatima", "Li", "Carlos", "Ana", "David", "Priya"]
+LAST_NAMES = ["Sharma", "Patel", "Smith", "Khan", "Wang", "Garcia", "Silva", "Brown", "Iyer", "Das"]
+FINDINGS = [
+    "The lungs are clear without focal consolidation, effusion or pneumothorax.",
+    "Cardiomediastinal silhouette is within normal limits.",
+    "No acute osseous abnormality is identified.",
+    "Mild degenerative changes are noted in the thoracic spine.",
+    "The liver is normal in size and echotexture with no focal lesion.",
+    "Gallbladder is distended with no calculi or wall thickening.",
+    "Both kidneys are normal in size with preserved corticomedullary differentiation.",
+    "A 6 mm nonobstructing calculus is seen in the lower pole of the left kidney.",
+]
+PATHOLOGY = [
+    "Sections show fragments of colonic mucosa with preserved crypt architecture.",
+    "There is mild chronic inflammation in the lamina propria.",
+    "No dysplasia or malignancy is identified.",
+    "Sections show a well-circumscribed lesion composed of spindle cells.",
+    "Mitotic activity is low and no necrosis is seen.",
+    "Surgical margins are free of tumour.",
+]
+
+def _styles():
+    return getSampleStyleSheet()
+
+def _header(rng, title, styles):
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    date = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2021, 2025)}"
+    sex = rng.choice(["Male", "Female"])
+    lines = [
+        Paragraph(f"<b>{title}</b>", styles["Title"]),
+        Paragraph(f"Patient Name: {name}", styles["Normal"]),
+        Paragraph(f"Age: {rng.randint(18, 90)}   Sex: {sex}", styles["Normal"]),
+        Paragraph(f"Collection Date: {date}", styles["Normal"]),
+        Spacer(1, 12),
+    ]
+    return lines
+
+def _table(rows):
+    table = Table(rows, colWidths=[160, 90, 80, 120])
+    table.setStyle(TableStyle([
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+    ]))
+    return table
+
+def _blood_page(rng):
+    rows = [["Test Name", "Result", "Unit", "Reference Range"]]
+    for name, unit, low, high in rng.sample(BLOOD_TESTS, 12):
+        value = rng.uniform(low * 0.7, high * 1.3)
+        rows.append([name, f"{value:.1f}", unit, f"{low}-{high}"])
+    return [_table(rows)]
+
+def _urine_page(rng):
+    rows = [["Test Name", "Result", "Unit", "Reference Range"]]
+    for name, choices, unit, reference_range in URINE_TESTS:
+        if choices:
+            value = rng.choice(choices)
+        elif name == "Specific Gravity":
+            value = f"{rng.uniform(1.003, 1.035):.3f}"
+        else:
+            value = f"{rng.uniform(0, 9):.1f}"
+        rows.append([name, value, unit, reference_range])
+    return [_table(rows)]
+
+def _text_page(rng, sentences, headings, styles):
+    elements = []
+    for heading in headings:
+        elements.append(Paragraph(f"<b>{heading}</b>", styles["Heading3"]))
+        elements.append(Paragraph(" ".join(rng.sample(sentences, 3)), styles["Normal"]))
+        elements.append(Spacer(1, 8))
+    return elements
+
+def build_report(path, kind, pages=1, seed=0):
+    rng = random.Random(f"{kind}-{pages}-{seed}")
+    styles = _styles()
+    title = {
+        "blood": "Complete Blood Count Report",
+        "urine": "Urine Routine Examination Report",
+        "imaging": "Radiology Report - Chest X-Ray",
+        "pathology": "Histopathology Report",
+    }[kind]
+    elements = _header(rng, title, styles)
+    for page in range(pages):
+        if kind == "blood":
+            elements.extend(_blood_page(rng))
+        elif kind == "urine":
+            elements.extend(_urine_page(rng))
+        elif kind == "imaging":
+            elements.extend(_text_page(rng, FINDINGS, ["Findings", "Impression"], styles))
+        else:
+            elements.extend(_text_page(rng, PATHOLOGY, ["Specimen", "Microscopic Description", "Diagnosis"],
+                                       styles))
+        if page < pages - 1:
+            elements.append(PageBreak())
+    SimpleDocTemplate(path, pagesize=A4).build(elements)
+    return path
+
+def build_corpus(output_dir, kinds=KINDS, page_counts=(1, 4, 16), copies=2, seed=0):
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for kind in kinds:
+        for pages in page_counts:
+            for copy in range(copies):
+                # the seed is part of the name, so an existing file is only reused for the same seed
+                path = os.path.join(output_dir, f"{kind}_{pages:03d}p_s{seed}_{copy:02d}.pdf")
+                if not os.path.exists(path):
+                    build_report(path, kind, pages, seed + copy)
+                paths.append(path)
+    return paths
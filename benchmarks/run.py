@@ -0,0 +1,157 @@
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+from .corpus import KINDS, build_corpus
+from .stub_llm import StubLLMServer
+
+STAGES = ("extract", "parse", "classify", "merge", "render")
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    # nearest-rank, so p99 of a small run is the slowest sample rather than an interpolation
+    rank = max(1, math.ceil(q / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+def summarize(samples):
+    total = sum(samples)
+    return {
+        "count": len(samples),
+        "total_seconds": round(total, 6),
+        "per_second": round(len(samples) / total, 2) if total else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+
+def timed(samples, fn):
+    def wrapper(*args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            samples.append(time.perf_counter() - start)
+    return wrapper
+
+def _configure_environment(base_url, cache_dir):
+    # must run before medreport is imported: its modules read configuration at import time
+    os.environ["GROQ_BASE_URL"] = base_url
+    os.environ["GROQ_APIKEY"] = "benchmark-stub"
+    os.environ["REPORT_CACHE_DIR"] = cache_dir
+    os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "0")
+    os.environ.setdefault("LLM_TOKENS_PER_MINUTE", "0")
+    os.environ.setdefault("METRICS_JSONL_FILE", "")
+
+def run_benchmark(paths, repeat=3, chart_backend=None, latency=0.2, jitter=0.05, error_rate=0.0):
+    server = StubLLMServer(latency=latency, jitter=jitter, error_rate=error_rate).start()
+    with tempfile.TemporaryDirectory(prefix="medreport-bench-cache-") as cache_dir:
+        _configure_environment(server.base_url, cache_dir)
+        from medreport.classify import get_report_type
+        from medreport.llm import TABLE_FAST_PATH, get_scheduler, parse_document
+        from medreport.merge import merge_reports
+        from medreport.metrics import metrics
+        from medreport.pdftext import extract_document
+        from medreport.render import generate_pdf
+
+        samples = {stage: [] for stage in STAGES}
+        metrics.reset()
+        scheduler = get_scheduler()
+        start = time.perf_counter()
+        results = scheduler.map(
+            paths,
+            timed(samples["extract"], lambda path: extract_document(path, with_tables=TABLE_FAST_PATH)),
+            timed(samples["parse"], lambda document: parse_document(document, False, scheduler))
+        )
+        pipeline_seconds = time.perf_counter() - start
+        errors = [f"{os.path.basename(result.item)}: {result.error}" for result in results if result.error]
+        reports = [report for result in results if result.value for report in result.value]
+
+        for _ in range(repeat):
+            for report in reports:
+                timed(samples["classify"], get_report_type)(report)
+            timed(samples["merge"], merge_reports)(reports)
+        for report in reports:
+            timed(samples["render"], generate_pdf)([report], BytesIO(), chart_backend)
+        start = time.perf_counter()
+        generate_pdf(reports, BytesIO(), chart_backend)
+        batch_render_seconds = time.perf_counter() - start
+        stub_requests = server.requests
+    server.stop()
+    return {
+        "files": len(paths),
+        "reports": len(reports),
+        "errors": errors,
+        "llm_requests": stub_requests,
+        "pipeline_seconds": round(pipeline_seconds, 3),
+        "files_per_second": round(len(paths) / pipeline_seconds, 2) if pipeline_seconds else 0.0,
+        "batch_render_seconds": round(batch_render_seconds, 3),
+        "stages": {stage: summarize(values) for stage, values in samples.items()},
+        "metrics": metrics.snapshot()["stages"],
+    }
+
+def compare(result, baseline, max_regression):
+    regressions = []
+    for stage, current in result["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous or not previous.get("p50_ms"):
+            continue
+        ratio = current["p50_ms"] / previous["p50_ms"]
+        if ratio > 1 + max_regression:
+            regressions.append(f"{stage}: p50 {previous['p50_ms']}ms -> {current['p50_ms']}ms ({ratio:.2f}x)")
+    return regressions
+
+def print_report(result):
+    print(f"{result['files']} files, {result['reports']} reports, {result['llm_requests']} LLM requests, "
+          f"{len(result['errors'])} errors")
+    print(f"pipeline: {result['pipeline_seconds']}s ({result['files_per_second']} files/s), "
+          f"batch render: {result['batch_render_seconds']}s")
+    print(f"{'stage':<10}{'count':>8}{'per sec':>12}{'p50 ms':>12}{'p99 ms':>12}")
+    for stage, summary in result["stages"].items():
+        print(f"{stage:<10}{summary['count']:>8}{summary['per_second']:>12}{summary['p50_ms']:>12}"
+              f"{summary['p99_ms']:>12}")
+    for error in result["errors"]:
+        print(f"error: {error}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark for the report pipeline.")
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "medreport-bench-corpus"))
+    parser.add_argument("--kinds", default=",".join(KINDS))
+    parser.add_argument("--pages", default="1,4,16", help="comma-separated page counts per synthetic report")
+    parser.add_argument("--copies", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions of the in-memory stages")
+    parser.add_argument("--chart-backend", choices=["matplotlib", "vector"])
+    parser.add_argument("--latency", type=float, default=0.2, help="mean stub LLM latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="allowed p50 slowdown per stage before the run fails (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    paths = build_corpus(args.corpus_dir, args.kinds.split(","), [int(p) for p in args.pages.split(",")],
+                         args.copies, args.seed)
+    result = run_benchmark(paths, args.repeat, args.chart_backend, args.latency, args.jitter,
+                           args.error_rate)
+    print_report(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PATIENT_NAME = re.compile(r'(?im)^\s*patient\s*name\s*:\s*(.+?)\s*$')
+TITLE = re.compile(r'(?im)^.*\b(report|examination)\b.*$')
+
+def canned_report(prompt):
+    name = PATIENT_NAME.search(prompt)
+    title = TITLE.search(prompt)
+    return {
+        "patient_info": {"name": name.group(1) if name else "", "age": 42, "sex": "Female"},
+        "report_type": title.group(0).strip() if title else "Lab Report",
+        "collection_date": "",
+        "test_results": [
+            {"test_name": "Hemoglobin", "value": "13.1", "unit": "g/dL", "reference_range": "12-16"},
+            {"test_name": "Glucose", "value": "104", "unit": "mg/dL", "reference_range": "70-100"},
+        ],
+        "doctor_notes": "Synthetic response from the benchmark stub.",
+        "summary": "",
+    }
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        prompt = "\n".join(message.get("content", "") for message in request.get("messages", [])
+                           if message.get("role") == "user")
+        time.sleep(max(0.0, random.gauss(server.latency, server.jitter)))
+        with server.lock:
+            server.requests += 1
+            fail = server.error_rate and random.random() < server.error_rate
+        if fail:
+            body = json.dumps({"error": {"message": "stub overloaded", "type": "rate_limit_exceeded"}}).encode()
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+        elif request.get("stream"):
+            self._stream(request, json.dumps(server.response if server.response is not None
+                                             else canned_report(prompt), indent=2), prompt)
+            return
+        else:
+            content = json.dumps(server.response if server.response is not None else canned_report(prompt))
+            body = json.dumps({
+                "id": f"chatcmpl-stub-{server.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", ""),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                          "total_tokens": (len(prompt) + len(content)) // 4},
+            }).encode()
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, request, content, prompt):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        chunk_size = self.server.stream_chunk_size
+        pieces = range(0, len(content), chunk_size)
+        for start in pieces:
+            time.sleep(self.server.stream_latency / len(pieces))
+            delta = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": request.get("model", ""),
+                     "choices": [{"index": 0, "delta": {"content": content[start:start + chunk_size]},
+                                  "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(delta)}\n\n".encode())
+            self.wfile.flush()
+        final = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                 "model": request.get("model", ""),
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                 "x_groq": {"usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                                      "total_tokens": (len(prompt) + len(content)) // 4}}}
+        self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+        self.wfile.flush()
+        self.close_connection = True
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.2, jitter=0.05, error_rate=0.0, response=None,
+                 stream_latency=0.5, stream_chunk_size=24):
+        super().__init__((host, port), StubHandler)
+        self.latency = latency
+        # streamed answers: the first token arrives after `latency`, the rest over `stream_latency`
+        self.stream_latency = stream_latency
+        self.stream_chunk_size = stream_chunk_size
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.response = response
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Groq chat-completions endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.2, help="mean response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="latency standard deviation in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--response-file", help="JSON file returned as the completion for every request")
+    args = parser.parse_args(argv)
+    response = None
+    if args.response_file:
+        with open(args.response_file, "r", encoding="utf-8") as f:
+            response = json.load(f)
+    server = StubLLMServer(args.host, args.port, args.latency, args.jitter, args.error_rate, response)
+    print(f"Stub LLM listening on {server.base_url} (set GROQ_BASE_URL to this address)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import importlib
+
+# name -> submodule; submodules (and their heavy dependencies such as
+# reportlab, matplotlib, pdfplumber and groq) are only imported on first access
+_EXPORTS = {
+    "get_report_type": "classify",
+    "classify_reports": "classify",
+    "register_category": "classify",
+    "is_blood_test": "classify",
+    "is_urine_test": "classify",
+    "is_imaging_report": "classify",
+    "is_pathology_report": "classify",
+    "parse_value_with_units": "parsing",
+    "parse_range": "parsing",
+    "RuleSet": "rules",
+    "qualitative_status": "rules",
+    "extract_test_results": "merge",
+    "export_test_results": "export",
+    "merge_reports": "merge",
+    "generate_pdf": "render",
+    "extract_pages": "pdftext",
+    "iter_page_texts": "pdftext",
+    "compact_pages": "compaction",
+    "parse_report_text": "llm",
+    "parse_report_pages": "llm",
+    "IncrementalReportParser": "streaming",
+    "ExtractionCache": "cache",
+    "SimilarityIndex": "dedup",
+    "LLMBackend": "backends",
+    "GroqBackend": "backends",
+    "LocalBackend": "backends",
+    "RetryingBackend": "backends",
+    "HedgedBackend": "backends",
+    "ExtractionScheduler": "scheduler",
+    "RateLimiter": "scheduler",
+    "ResultsStore": "store",
+    "JobQueue": "jobs",
+    "Metrics": "metrics",
+    "metrics": "metrics",
+}
+
+__all__ = sorted(_EXPORTS)
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,249 @@
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .metrics import metrics
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "16"))
+# seconds to wait for the first response before sending a duplicate request; 0 disables hedging
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "0"))
+
+Completion = namedtuple("Completion", ["content", "usage"])
+Usage = namedtuple("Usage", ["prompt_tokens", "completion_tokens"])
+
+TRANSIENT_ERROR_NAMES = {"APIConnectionError", "APITimeoutError", "TimeoutException", "TransportError",
+                         "TimeoutError", "ConnectionError"}
+
+def is_transient_error(exc):
+    status_code = getattr(exc, "status_code", None)
+    if status_code is not None:
+        # 429 is left to the scheduler, which pauses every worker instead of just this call
+        return status_code in (408, 409) or status_code >= 500
+    return any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(exc).__mro__)
+
+class LLMBackend:
+    def complete(self, system_prompt, user_prompt, model, timeout=None):
+        raise NotImplementedError
+
+    def stream(self, system_prompt, user_prompt, model, timeout=None, on_usage=None):
+        completion = self.complete(system_prompt, user_prompt, model, timeout)
+        if on_usage is not None:
+            on_usage(completion.usage)
+        yield completion.content
+
+    def close(self):
+        pass
+
+class GroqBackend(LLMBackend):
+    def __init__(self, api_key=None, base_url=None, max_connections=LLM_MAX_CONNECTIONS, timeout=LLM_TIMEOUT):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                import httpx
+                from dotenv import load_dotenv
+                from groq import Groq
+                load_dotenv()
+                # one pooled keep-alive session shared by every worker thread; retries are
+                # done by RetryingBackend so the SDK's own retry loop is switched off
+                http_client = httpx.Client(
+                    limits=httpx.Limits(max_connections=self.max_connections,
+                                        max_keepalive_connections=self.max_connections),
+                    timeout=self.timeout
+                )
+                self._client = Groq(api_key=self.api_key or os.getenv("GROQ_APIKEY"), base_url=self.base_url,
+                                    http_client=http_client, max_retries=0)
+            return self._client
+
+    def complete(self, system_prompt, user_prompt, model, timeout=None):
+        completion = self.client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            response_format={"type": "json_object"},
+            timeout=timeout or self.timeout
+        )
+        usage = getattr(completion, "usage", None)
+        return Completion(
+            completion.choices[0].message.content,
+            Usage(getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0)
+        )
+
+    def stream(self, system_prompt, user_prompt, model, timeout=None, on_usage=None):
+        # JSON mode cannot be combined with streaming on Groq, so the schema in the system
+        # prompt is relied on and the parser skips anything written before the JSON
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            stream=True,
+            timeout=timeout or self.timeout
+        )
+        try:
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+                if usage is not None and on_usage is not None:
+                    on_usage(Usage(getattr(usage, "prompt_tokens", 0) or 0,
+                                   getattr(usage, "completion_tokens", 0) or 0))
+        finally:
+            response.close()
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+class LocalBackend(LLMBackend):
+    def __init__(self, responder=None, latency=0.0, stream_chunk_size=16):
+        self.responder = responder
+        self.latency = latency
+        self.stream_chunk_size = stream_chunk_size
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _respond(self, system_prompt, user_prompt, model):
+        with self._lock:
+            self.calls += 1
+        if self.responder is None:
+            content = {"patient_info": {}, "report_type": "", "test_results": [], "doctor_notes": ""}
+        else:
+            content = self.responder(system_prompt, user_prompt, model)
+        if not isinstance(content, str):
+            content = json.dumps(content)
+        return Completion(content, Usage(len(system_prompt + user_prompt) // 4, len(content) // 4))
+
+    def complete(self, system_prompt, user_prompt, model, timeout=None):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(system_prompt, user_prompt, model)
+
+    def stream(self, system_prompt, user_prompt, model, timeout=None, on_usage=None):
+        completion = self._respond(system_prompt, user_prompt, model)
+        content = completion.content
+        pieces = range(0, len(content), self.stream_chunk_size)
+        for start in pieces:
+            if self.latency:
+                time.sleep(self.latency / len(pieces))
+            yield content[start:start + self.stream_chunk_size]
+        if on_usage is not None:
+            on_usage(completion.usage)
+
+class RetryingBackend(LLMBackend):
+    def __init__(self, backend, max_retries=LLM_MAX_RETRIES, base_delay=0.5, max_delay=20.0,
+                 is_retryable=is_transient_error, sleep=time.sleep):
+        self.backend = backend
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.is_retryable = is_retryable
+        self._sleep = sleep
+
+    def complete(self, system_prompt, user_prompt, model, timeout=None):
+        attempt = 0
+        while True:
+            try:
+                return self.backend.complete(system_prompt, user_prompt, model, timeout)
+            except Exception as exc:
+                if attempt >= self.max_retries or not self.is_retryable(exc):
+                    raise
+            # full jitter keeps concurrent workers from retrying in lockstep
+            delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+            self._sleep(random.uniform(0, delay))
+            metrics.increment("llm_retries")
+            attempt += 1
+
+    def stream(self, system_prompt, user_prompt, model, timeout=None, on_usage=None):
+        attempt = 0
+        while True:
+            started = False
+            try:
+                for delta in self.backend.stream(system_prompt, user_prompt, model, timeout, on_usage):
+                    started = True
+                    yield delta
+                return
+            except Exception as exc:
+                # text already handed to the caller cannot be taken back, so only retry before it
+                if started or attempt >= self.max_retries or not self.is_retryable(exc):
+                    raise
+            delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+            self._sleep(random.uniform(0, delay))
+            metrics.increment("llm_retries")
+            attempt += 1
+
+    def close(self):
+        self.backend.close()
+
+class HedgedBackend(LLMBackend):
+    def __init__(self, backend, hedge_after=LLM_HEDGE_AFTER, max_hedges=1, max_workers=32):
+        self.backend = backend
+        self.hedge_after = hedge_after
+        self.max_hedges = max_hedges
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-hedge")
+
+    def _submit(self, *args):
+        return self._pool.submit(contextvars.copy_context().run, self.backend.complete, *args)
+
+    def complete(self, system_prompt, user_prompt, model, timeout=None):
+        args = (system_prompt, user_prompt, model, timeout)
+        pending = {self._submit(*args)}
+        hedges = 0
+        errors = []
+        while pending:
+            wait_for = self.hedge_after if hedges < self.max_hedges and not errors else None
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            if not done:
+                # the first request is in the slow tail: race a duplicate against it
+                pending.add(self._submit(*args))
+                hedges += 1
+                metrics.increment("llm_hedged_requests")
+                continue
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                errors.append(future.exception())
+        raise errors[0]
+
+    def stream(self, system_prompt, user_prompt, model, timeout=None, on_usage=None):
+        # a stream is consumed as it arrives, so it is not hedged
+        return self.backend.stream(system_prompt, user_prompt, model, timeout, on_usage)
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        self.backend.close()
+
+def create_backend(name=LLM_BACKEND, max_retries=LLM_MAX_RETRIES, hedge_after=LLM_HEDGE_AFTER):
+    if name == "groq":
+        backend = GroqBackend()
+    elif name == "local":
+        backend = LocalBackend()
+    else:
+        raise ValueError(f"Unknown LLM_BACKEND {name!r}; expected 'groq' or 'local'")
+    if max_retries:
+        backend = RetryingBackend(backend, max_retries)
+    if hedge_after:
+        backend = HedgedBackend(backend, hedge_after)
+    return backend
@@ -0,0 +1,129 @@
+import math
+import threading
+from collections import OrderedDict
+
+from reportlab.graphics import renderPDF
+from reportlab.graphics.shapes import Drawing, Group, Line, Rect, String
+from reportlab.lib import colors
+from reportlab.platypus import Flowable
+
+CHART_WIDTH = 550
+CHART_HEIGHT = 330
+RENDER_CACHE_SIZE = 256
+
+VALUE_COLOR = colors.HexColor("#2ecc71")
+OUT_OF_RANGE_COLOR = colors.HexColor("#e74c3c")
+RANGE_COLOR = colors.HexColor("#3498db")
+GRID_COLOR = colors.Color(0, 0, 0, alpha=0.15)
+
+_render_cache = OrderedDict()
+_render_cache_lock = threading.Lock()
+
+class CachedDrawing(Flowable):
+    # platypus keeps layout state on the flowable itself, so each use of a cached
+    # drawing gets its own thin wrapper instead of sharing the Drawing instance
+    def __init__(self, drawing):
+        Flowable.__init__(self)
+        self.drawing = drawing
+        self.width = drawing.width
+        self.height = drawing.height
+
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+
+    def draw(self):
+        renderPDF.draw(self.drawing, self.canv, 0, 0)
+
+def _nice_step(span, target_ticks=6):
+    if span <= 0:
+        return 1.0
+    raw = span / target_ticks
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for factor in (1, 2, 2.5, 5, 10):
+        if raw <= factor * magnitude:
+            return factor * magnitude
+    return 10 * magnitude
+
+def _format_tick(value):
+    return f"{value:g}" if abs(value) < 1e6 else f"{value:.1e}"
+
+def _build_blood_chart(test_names, actual_values, normal_mins, normal_maxs, title):
+    drawing = Drawing(CHART_WIDTH, CHART_HEIGHT)
+    left, right, bottom, top = 55, CHART_WIDTH - 15, 95, CHART_HEIGHT - 50
+    plot_w, plot_h = right - left, top - bottom
+    midpoints = [(lo + hi) / 2 for lo, hi in zip(normal_mins, normal_maxs)]
+    y_max = max(list(actual_values) + list(normal_maxs) + [0]) * 1.15 or 1.0
+    step = _nice_step(y_max)
+    y_max = math.ceil(y_max / step) * step
+
+    def y_at(value):
+        return bottom + plot_h * max(0.0, value) / y_max
+
+    drawing.add(String(CHART_WIDTH / 2, CHART_HEIGHT - 22, title, fontName="Helvetica-Bold",
+                       fontSize=12, textAnchor="middle"))
+    tick = 0.0
+    while tick <= y_max + step / 2:
+        y = y_at(tick)
+        drawing.add(Line(left, y, right, y, strokeColor=GRID_COLOR, strokeWidth=0.5))
+        drawing.add(String(left - 4, y - 3, _format_tick(tick), fontName="Helvetica", fontSize=7,
+                           textAnchor="end"))
+        tick += step
+    drawing.add(Line(left, bottom, right, bottom, strokeColor=colors.black, strokeWidth=1))
+    drawing.add(Line(left, bottom, left, top, strokeColor=colors.black, strokeWidth=1))
+    label = Group(String(0, 0, "Values", fontName="Helvetica-Bold", fontSize=9, textAnchor="middle"))
+    label.translate(14, bottom + plot_h / 2)
+    label.rotate(90)
+    drawing.add(label)
+
+    group_w = plot_w / max(1, len(test_names))
+    bar_w = group_w * 0.35
+    for i, (name, actual, mid, lo, hi) in enumerate(zip(test_names, actual_values, midpoints,
+                                                        normal_mins, normal_maxs)):
+        center = left + (i + 0.5) * group_w
+        value_color = OUT_OF_RANGE_COLOR if actual < lo or actual > hi else VALUE_COLOR
+        drawing.add(Rect(center - bar_w, bottom, bar_w, y_at(actual) - bottom, fillColor=value_color,
+                         strokeColor=colors.black, strokeWidth=0.8))
+        drawing.add(Rect(center, bottom, bar_w, y_at(mid) - bottom, fillColor=RANGE_COLOR,
+                         strokeColor=colors.black, strokeWidth=0.8))
+        range_x = center + bar_w / 2
+        drawing.add(Line(range_x, y_at(lo), range_x, y_at(hi), strokeColor=colors.black, strokeWidth=0.8))
+        for bound in (lo, hi):
+            drawing.add(Line(range_x - 4, y_at(bound), range_x + 4, y_at(bound),
+                             strokeColor=colors.black, strokeWidth=0.8))
+        drawing.add(String(center - bar_w / 2, y_at(actual) + 3, f"{actual:.1f}",
+                           fontName="Helvetica-Bold", fontSize=7, textAnchor="middle"))
+        drawing.add(String(range_x, y_at(max(mid, hi)) + 3, f"{lo:.1f}-{hi:.1f}",
+                           fontName="Helvetica", fontSize=6.5, textAnchor="middle"))
+        tick_label = Group(String(0, 0, name, fontName="Helvetica", fontSize=8, textAnchor="end"))
+        tick_label.translate(center, bottom - 8)
+        tick_label.rotate(45)
+        drawing.add(tick_label)
+
+    drawing.add(String(left + plot_w / 2, 6, "Blood Tests", fontName="Helvetica-Bold", fontSize=9,
+                       textAnchor="middle"))
+    legend_y = top + 8
+    for x, fill, text in ((right - 185, VALUE_COLOR, "Your Values"),
+                          (right - 115, RANGE_COLOR, "Normal Range (Average)")):
+        drawing.add(Rect(x, legend_y, 8, 8, fillColor=fill, strokeColor=colors.black, strokeWidth=0.5))
+        drawing.add(String(x + 11, legend_y + 1, text, fontName="Helvetica", fontSize=7))
+    return drawing
+
+def blood_chart_drawing(test_names, actual_values, normal_mins, normal_maxs, title, use_cache=True):
+    key = (tuple(test_names), tuple(actual_values), tuple(normal_mins), tuple(normal_maxs), title)
+    if use_cache:
+        with _render_cache_lock:
+            drawing = _render_cache.get(key)
+            if drawing is not None:
+                _render_cache.move_to_end(key)
+                return CachedDrawing(drawing)
+    drawing = _build_blood_chart(test_names, actual_values, normal_mins, normal_maxs, title)
+    if use_cache:
+        with _render_cache_lock:
+            _render_cache[key] = drawing
+            while len(_render_cache) > RENDER_CACHE_SIZE:
+                _render_cache.popitem(last=False)
+    return CachedDrawing(drawing)
+
+def clear_render_cache():
+    with _render_cache_lock:
+        _render_cache.clear()
@@ -0,0 +1,112 @@
+import contextvars
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+SECTION_BREAK = re.compile(r'\n\s*\n|\n(?=[A-Z][A-Z /&()-]{3,}:?\s*\n)|\n(?=[^\n]{1,60}:\s*\n)')
+
+def _split_oversized(text, max_chars):
+    pieces = [p for p in SECTION_BREAK.split(text) if p and p.strip()]
+    parts = []
+    for piece in pieces:
+        if len(piece) <= max_chars:
+            parts.append(piece)
+            continue
+        current = ""
+        for line in piece.split("\n"):
+            while len(line) > max_chars:
+                if current:
+                    parts.append(current)
+                    current = ""
+                parts.append(line[:max_chars])
+                line = line[max_chars:]
+            if current and len(current) + 1 + len(line) > max_chars:
+                parts.append(current)
+                current = line
+            else:
+                current = f"{current}\n{line}" if current else line
+        if current:
+            parts.append(current)
+    return parts
+
+def iter_chunks(pages, max_chars):
+    current = ""
+    for page in pages:
+        if not page or not page.strip():
+            continue
+        segments = [page] if len(page) <= max_chars else _split_oversized(page, max_chars)
+        for segment in segments:
+            if current and len(current) + 1 + len(segment) > max_chars:
+                yield current
+                current = segment
+            else:
+                current = f"{current}\n{segment}" if current else segment
+    if current:
+        yield current
+
+def split_into_chunks(pages, max_chars):
+    return list(iter_chunks(pages, max_chars))
+
+def _test_key(test):
+    return (
+        str(test.get("test_name") or "").strip().lower(),
+        str(test.get("value") or "").strip().lower(),
+        str(test.get("unit") or "").strip().lower(),
+    )
+
+def merge_chunk_results(chunk_results):
+    reports = []
+    for result in chunk_results:
+        if isinstance(result, dict):
+            reports.append(result)
+        elif result:
+            reports.extend(r for r in result if isinstance(r, dict))
+    merged = {
+        "patient_info": {},
+        "report_type": "",
+        "collection_date": "",
+        "test_results": [],
+        "doctor_notes": "",
+        "summary": ""
+    }
+    seen_tests = set()
+    notes = []
+    summaries = []
+    for report in reports:
+        for field, value in (report.get("patient_info") or {}).items():
+            if value not in (None, "") and merged["patient_info"].get(field) in (None, ""):
+                merged["patient_info"][field] = value
+        if not merged["report_type"] and report.get("report_type"):
+            merged["report_type"] = report["report_type"]
+        if not merged["collection_date"] and report.get("collection_date"):
+            merged["collection_date"] = report["collection_date"]
+        for test in report.get("test_results") or []:
+            key = _test_key(test)
+            if not key[0] or key in seen_tests:
+                continue
+            seen_tests.add(key)
+            merged["test_results"].append(test)
+        note = str(report.get("doctor_notes") or "").strip()
+        if note and note not in notes:
+            notes.append(note)
+        summary = str(report.get("summary") or "").strip()
+        if summary and summary not in summaries:
+            summaries.append(summary)
+    merged["doctor_notes"] = "\n\n".join(notes)
+    merged["summary"] = " ".join(summaries)
+    if not merged["report_type"]:
+        merged["report_type"] = "Unknown"
+    return [merged]
+
+def extract_chunked(pages, parse_fn, max_chars):
+    # pages may be a lazy iterator: each chunk is submitted as soon as it is
+    # complete, so LLM calls start while later pages are still being parsed
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        # each chunk runs in a copy of the caller's context so metrics keep the file label
+        futures = [pool.submit(contextvars.copy_context().run, parse_fn, chunk)
+                   for chunk in iter_chunks(pages, max_chars)]
+        chunk_results = [future.result() for future in futures]
+    if not chunk_results:
+        return []
+    if len(chunk_results) == 1:
+        return chunk_results[0]
+    return merge_chunk_results(chunk_results)
@@ -0,0 +1,133 @@
+import re
+import threading
+from collections import namedtuple
+
+# A category matches when its report_keywords occur anywhere in the report type,
+# when a test name equals one of its test_names, or when a test name contains one
+# of its test_name_substrings. Categories are tried in priority order (lowest
+# first) and the first match wins; anything unmatched is "other".
+Category = namedtuple("Category", ["name", "report_keywords", "test_names", "test_name_substrings"])
+
+DEFAULT_CATEGORIES = [
+    Category("blood",
+             ["blood", "hematology", "serum", "plasma", "cbc", "lipid", "glucose"],
+             ["hemoglobin", "wbc count", "rbc count", "platelet count", "glucose", "cholesterol"],
+             []),
+    Category("urine",
+             ["urine", "urinalysis", "ua"],
+             ["urine color", "urine ph", "specific gravity", "leukocytes", "nitrite", "protein",
+              "glucose in urine", "ketones"],
+             []),
+    Category("imaging",
+             ["x-ray", "xray", "mri", "ct scan", "ultrasound", "imaging", "radiograph", "sonogram"],
+             [],
+             ["impression", "finding"]),
+    Category("pathology",
+             ["pathology", "histology", "biopsy", "cytology"],
+             [],
+             ["specimen", "tissue"]),
+]
+
+def _keyword_matcher(keywords_by_priority):
+    alternatives = []
+    group_priority = {}
+    for priority, keywords in enumerate(keywords_by_priority):
+        if not keywords:
+            continue
+        group = f"c{priority}"
+        group_priority[group] = priority
+        alternatives.append(f"(?P<{group}>{'|'.join(re.escape(k) for k in keywords)})")
+    if not alternatives:
+        return None, group_priority
+    # zero-width lookahead so every start position is tried; at each position the
+    # alternation prefers the highest-priority category that matches there
+    return re.compile(f"(?=(?:{'|'.join(alternatives)}))"), group_priority
+
+MEMO_SIZE = 65536
+
+class ReportClassifier:
+    def __init__(self, categories=DEFAULT_CATEGORIES):
+        self.categories = list(categories)
+        self._names = [category.name for category in self.categories]
+        self._report_matcher, self._report_groups = _keyword_matcher(
+            [category.report_keywords for category in self.categories])
+        self._name_matcher, self._name_groups = _keyword_matcher(
+            [category.test_name_substrings for category in self.categories])
+        self._exact_names = {}
+        for priority, category in enumerate(self.categories):
+            for name in category.test_names:
+                self._exact_names.setdefault(name, priority)
+        # test names and report types repeat heavily across a batch
+        self._name_priorities = {}
+        self._type_priorities = {}
+
+    @staticmethod
+    def _best(matcher, groups, text, best):
+        if matcher is None or not text:
+            return best
+        for match in matcher.finditer(text):
+            priority = groups[match.lastgroup]
+            if priority < best:
+                best = priority
+                if best == 0:
+                    break
+        return best
+
+    def _memo(self, memo, key, compute):
+        priority = memo.get(key)
+        if priority is None:
+            if len(memo) >= MEMO_SIZE:
+                memo.clear()
+            priority = memo[key] = compute(key)
+        return priority
+
+    def _type_priority(self, report_type):
+        return self._best(self._report_matcher, self._report_groups, report_type, len(self.categories))
+
+    def _name_priority(self, test_name):
+        best = self._exact_names.get(test_name, len(self.categories))
+        return self._best(self._name_matcher, self._name_groups, test_name, best)
+
+    def classify(self, report):
+        worst = len(self.categories)
+        best = self._memo(self._type_priorities, (report.get("report_type") or "").lower(), self._type_priority)
+        for test in report.get("test_results") or []:
+            if best == 0:
+                break
+            test_name = (test.get("test_name") or "").lower()
+            best = min(best, self._memo(self._name_priorities, test_name, self._name_priority))
+        return self._names[best] if best < worst else "other"
+
+    def classify_many(self, reports):
+        return [self.classify(report) for report in reports]
+
+_lock = threading.Lock()
+_categories = list(DEFAULT_CATEGORIES)
+_classifier = ReportClassifier(_categories)
+
+def register_category(name, report_keywords=(), test_names=(), test_name_substrings=(), priority=None):
+    global _classifier
+    category = Category(name, [k.lower() for k in report_keywords], [n.lower() for n in test_names],
+                        [s.lower() for s in test_name_substrings])
+    with _lock:
+        _categories[:] = [c for c in _categories if c.name != name]
+        _categories.insert(len(_categories) if priority is None else priority, category)
+        _classifier = ReportClassifier(_categories)
+
+def get_report_type(report):
+    return _classifier.classify(report)
+
+def classify_reports(reports):
+    return _classifier.classify_many(reports)
+
+def is_blood_test(report):
+    return get_report_type(report) == "blood"
+
+def is_urine_test(report):
+    return get_report_type(report) == "urine"
+
+def is_imaging_report(report):
+    return get_report_type(report) == "imaging"
+
+def is_pathology_report(report):
+    return get_report_type(report) == "pathology"
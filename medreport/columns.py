@@ -0,0 +1,103 @@
+from functools import lru_cache
+
+import numpy as np
+
+from .parsing import parse_range, parse_value_with_units
+
+STATUS_UNKNOWN = 0
+STATUS_NORMAL = 1
+STATUS_BELOW = 2
+STATUS_ABOVE = 3
+STATUS_LABELS = np.array(["", "Normal", "Below Normal", "Above Normal"], dtype=object)
+
+@lru_cache(maxsize=65536)
+def _parse_value(value_str):
+    return parse_value_with_units(value_str)
+
+@lru_cache(maxsize=65536)
+def _parse_range(range_str):
+    return parse_range(range_str)
+
+def _as_text(value):
+    if value is None:
+        return ""
+    return str(value) if isinstance(value, float) else str(value).strip()
+
+class TestResultColumns:
+    def __init__(self, report_index, names, raw_values, units, raw_ranges, values, range_min, range_max,
+                 offsets):
+        self.report_index = report_index
+        self.names = names
+        self.raw_values = raw_values
+        self.units = units
+        self.raw_ranges = raw_ranges
+        self.values = values
+        self.range_min = range_min
+        self.range_max = range_max
+        self.offsets = offsets
+        self.status = self.evaluate_status()
+
+    @classmethod
+    def from_reports(cls, reports):
+        report_index, names, raw_values, units, raw_ranges = [], [], [], [], []
+        values, range_min, range_max = [], [], []
+        offsets = [0]
+        for i, report in enumerate(reports):
+            for test in report.get("test_results") or []:
+                value_str = _as_text(test.get("value"))
+                range_str = _as_text(test.get("reference_range"))
+                value = _parse_value(value_str)
+                low, high = _parse_range(range_str)
+                report_index.append(i)
+                names.append(_as_text(test.get("test_name")))
+                raw_values.append(value_str)
+                units.append(_as_text(test.get("unit")))
+                raw_ranges.append(range_str)
+                values.append(np.nan if value is None else value)
+                range_min.append(np.nan if low is None else low)
+                range_max.append(np.nan if high is None else high)
+            offsets.append(len(names))
+        return cls(
+            np.array(report_index, dtype=np.int64),
+            np.array(names, dtype=object),
+            np.array(raw_values, dtype=object),
+            np.array(units, dtype=object),
+            np.array(raw_ranges, dtype=object),
+            np.array(values, dtype=np.float64),
+            np.array(range_min, dtype=np.float64),
+            np.array(range_max, dtype=np.float64),
+            np.array(offsets, dtype=np.int64),
+        )
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def report_count(self):
+        return len(self.offsets) - 1
+
+    @property
+    def has_range(self):
+        return ~np.isnan(self.values) & ~np.isnan(self.range_min) & ~np.isnan(self.range_max)
+
+    def evaluate_status(self):
+        with np.errstate(invalid="ignore"):
+            below = self.values < self.range_min
+            above = self.values > self.range_max
+        return np.where(
+            self.has_range,
+            np.where(below, STATUS_BELOW, np.where(above, STATUS_ABOVE, STATUS_NORMAL)),
+            STATUS_UNKNOWN,
+        ).astype(np.int8)
+
+    def status_labels(self):
+        return STATUS_LABELS[self.status]
+
+    def for_report(self, i):
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        view = TestResultColumns.__new__(TestResultColumns)
+        for field in ("report_index", "names", "raw_values", "units", "raw_ranges", "values", "range_min",
+                      "range_max", "status"):
+            setattr(view, field, getattr(self, field)[start:stop])
+        view.offsets = np.array([0, stop - start], dtype=np.int64)
+        return view
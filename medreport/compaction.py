@@ -0,0 +1,98 @@
+import logging
+import re
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# letterheads, addresses and footers live in the first and last few lines of a page
+EDGE_LINES = 6
+MIN_REPEAT_LENGTH = 4
+
+PAGE_NUMBER = re.compile(r'(?i)^\s*(?:page\s*(?:no\.?\s*)?\d+(?:\s*(?:of|/)\s*\d+)?|-\s*\d+\s*-)\s*$')
+# "3" or "1/4" alone is only a page number on the very first or last line; elsewhere it may be a value
+BARE_PAGE_NUMBER = re.compile(r'^\s*\d{1,3}(?:\s*/\s*\d{1,3})?\s*$')
+BOILERPLATE = [
+    re.compile(r'(?i)^\W*end of (?:the )?report\W*$'),
+    re.compile(r'(?i)\bcomputer[- ]generated report\b'),
+    re.compile(r'(?i)\bdoes not require (?:a )?(?:physical )?signature\b'),
+    re.compile(r'(?i)^\s*disclaimer\b'),
+    re.compile(r'(?i)\bresults? (?:relate|pertain)s? only to the (?:sample|specimen)'),
+    re.compile(r'(?i)\bnot (?:valid|to be used) for medico[- ]legal purposes?\b'),
+    re.compile(r'(?i)^\s*(?:printed|generated) (?:on|by|at)\b'),
+    re.compile(r'(?i)^\s*(?:tel|phone|fax|email|e-mail|website|www)\b[\s.:]'),
+    re.compile(r'(?i)^\s*www\.\S+\s*$'),
+]
+WHITESPACE = re.compile(r'[ \t\f\v\xa0]+')
+
+def is_boilerplate(line):
+    return bool(PAGE_NUMBER.match(line)) or any(pattern.search(line) for pattern in BOILERPLATE)
+
+class PageCompactor:
+    def __init__(self, edge_lines=EDGE_LINES):
+        self.edge_lines = edge_lines
+        self.chars_in = 0
+        self.chars_out = 0
+        self.lines_dropped = 0
+        self._seen_edges = set()
+
+    def compact(self, page):
+        self.chars_in += len(page or "")
+        lines = [WHITESPACE.sub(" ", line).strip() for line in (page or "").splitlines()]
+        # blank lines mark section breaks for chunking; keep at most one in a row
+        content = [i for i, line in enumerate(lines) if line]
+        # position from the top (or, negative, from the bottom): letterheads and footers sit in the
+        # same place on every page, while repeated result lines rarely do
+        edges = {}
+        for rank, i in enumerate(content[-self.edge_lines:]):
+            edges[i] = rank - min(self.edge_lines, len(content))
+        for rank, i in enumerate(content[:self.edge_lines]):
+            edges[i] = rank
+        kept = []
+        page_edges = set()
+        for i, line in enumerate(lines):
+            if not line:
+                if kept and kept[-1]:
+                    kept.append("")
+                continue
+            if is_boilerplate(line) or (i in (content[0], content[-1]) and BARE_PAGE_NUMBER.match(line)):
+                self.lines_dropped += 1
+                continue
+            if i in edges and len(line) >= MIN_REPEAT_LENGTH:
+                key = (edges[i], line.lower())
+                # the first occurrence is kept, so a patient name in the letterhead still reaches the LLM
+                if key in self._seen_edges:
+                    self.lines_dropped += 1
+                    continue
+                page_edges.add(key)
+            kept.append(line)
+        self._seen_edges |= page_edges
+        while kept and not kept[-1]:
+            kept.pop()
+        text = "\n".join(kept)
+        self.chars_out += len(text)
+        return text
+
+    @property
+    def chars_saved(self):
+        return self.chars_in - self.chars_out
+
+    @property
+    def tokens_saved(self):
+        # same ~4 characters per token rule as scheduler.estimate_tokens
+        return max(0, self.chars_saved) // 4
+
+def iter_compacted(pages, record=True):
+    compactor = PageCompactor()
+    for page in pages:
+        text = compactor.compact(page)
+        if text:
+            yield text
+    if record and compactor.chars_in:
+        metrics.increment("compaction_chars_saved", compactor.chars_saved)
+        metrics.increment("compaction_tokens_saved", compactor.tokens_saved)
+        logger.info("Prompt compaction removed %d of %d characters (~%d tokens, %d lines)",
+                    compactor.chars_saved, compactor.chars_in, compactor.tokens_saved, compactor.lines_dropped)
+
+def compact_pages(pages):
+    return list(iter_compacted(pages))
@@ -0,0 +1,342 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import numpy as np
+
+from .cache import DEFAULT_CACHE_DIR
+from .merge import normalize_patient
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUPLICATES_ENABLED = os.getenv("NEAR_DUPLICATES", "1") == "1"
+SIMILARITY_DB_PATH = os.getenv("SIMILARITY_DB_PATH", os.path.join(DEFAULT_CACHE_DIR, "similarity.db"))
+# estimated Jaccard similarity of the word shingles above which a document or page counts as a copy
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.9"))
+SIMILARITY_MAX_DOCUMENTS = int(os.getenv("SIMILARITY_MAX_DOCUMENTS", "10000"))
+# longest a copy waits for the first copy's extraction before extracting itself
+DUPLICATE_WAIT_SECONDS = float(os.getenv("DUPLICATE_WAIT_SECONDS", "300"))
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+BANDS = 32
+# pages with fewer shingles than this (blank pages, "Page 2 of 2") are not compared on their own
+MIN_SHINGLES = 20
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+WORD = re.compile(r'[a-z0-9]+(?:\.[0-9]+)?')
+MEASUREMENT = re.compile(r'[<>]?\d+(?:\.\d+)?%?')
+# labelled header fields that identify the patient ("Patient Name: ...", "UHID: ...", "Lab No: ...")
+IDENTITY = re.compile(r'\b(?:name|patient|uhid|mrn|(?:sample|lab|reg|registration)\s*(?:id|no))\b[^:\n]{0,12}:\s*([^\n]*)',
+                      re.IGNORECASE)
+
+Signature = namedtuple("Signature", ["minhash", "fingerprint", "pages"])
+PageSignature = namedtuple("PageSignature", ["minhash", "fingerprint"])
+Match = namedtuple("Match", ["name", "similarity", "kind", "reports"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    extractor TEXT NOT NULL,
+    name TEXT,
+    minhash BLOB NOT NULL,
+    fingerprint TEXT NOT NULL,
+    reports TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    minhash BLOB,
+    fingerprint TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bands (
+    key BLOB NOT NULL,
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    page_id INTEGER REFERENCES pages(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_bands_key ON bands(key);
+CREATE INDEX IF NOT EXISTS idx_documents_extractor ON documents(extractor, created_at);
+"""
+
+_permutations = np.random.RandomState(20240101).randint(1, int(MAX_HASH), size=(2, NUM_PERM), dtype=np.uint64)
+
+def _shingles(text):
+    words = WORD.findall(text.lower())
+    if len(words) <= SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def _words(text):
+    return set(WORD.findall(str(text or "").lower()))
+
+def _fingerprint(text):
+    # two copies of a report only count as duplicates if every measured value agrees; a re-test
+    # that changes one result is nearly identical text but must be extracted again. The same
+    # template filled in for another patient differs in little more than the header, so the
+    # labelled identity fields must agree as well
+    values = sorted(token.strip("(),;:") for token in text.split() if MEASUREMENT.fullmatch(token.strip("(),;:")))
+    identity = sorted(word for found in IDENTITY.finditer(text) for word in WORD.findall(found.group(1).lower()))
+    return hashlib.sha1((" ".join(values) + "|" + " ".join(identity)).encode("utf-8")).hexdigest()
+
+def minhash(shingles):
+    if not shingles:
+        return None
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    a, b = _permutations
+    return (((hashes[:, None] * a + b) % MERSENNE_PRIME) & MAX_HASH).min(axis=0).astype(np.uint32)
+
+def similarity(first, second):
+    return float(np.count_nonzero(first == second)) / len(first)
+
+def signature(pages):
+    page_signatures = []
+    for page in pages:
+        shingles = _shingles(page)
+        page_signatures.append(PageSignature(minhash(shingles) if len(shingles) >= MIN_SHINGLES else None,
+                                             _fingerprint(page)))
+    text = "\n".join(pages)
+    shingles = _shingles(text)
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    return Signature(minhash(shingles), _fingerprint(text), page_signatures)
+
+def _band_keys(values):
+    rows = NUM_PERM // BANDS
+    return [bytes([band]) + values[band * rows:(band + 1) * rows].tobytes() for band in range(BANDS)]
+
+def _page_subset_score(pages, candidate_pages, threshold):
+    # every page of the new document must be a copy of some page of the candidate: same measured
+    # values, and for pages with enough text also a similar shingle signature
+    scores = []
+    for page in pages:
+        same_values = [other for other in candidate_pages if other.fingerprint == page.fingerprint]
+        if not same_values:
+            return None
+        if page.minhash is None:
+            continue
+        best = max((similarity(page.minhash, other.minhash) for other in same_values if other.minhash is not None),
+                   default=0.0)
+        if best < threshold:
+            return None
+        scores.append(best)
+    return min(scores) if scores else None
+
+def _on_one_line(test, lines):
+    # the value must directly follow the name, so a reference range on the same line does not count
+    name = WORD.findall(str(test.get("test_name") or "").lower())
+    value = WORD.findall(str(test.get("value") or "").lower())
+    for line in lines:
+        if not set(name) <= set(line):
+            continue
+        end = max((line.index(word) for word in name), default=-1) + 1
+        if line[end:end + len(value)] == value:
+            return True
+    return False
+
+def _reusable(kind, reports, text):
+    words = _words(text)
+    lines = [WORD.findall(line.lower()) for line in text.splitlines()]
+    reused = []
+    for report in reports:
+        # the patient an earlier extraction names must appear in this document too
+        same_patient = _words(normalize_patient(report.get("patient_info"))) <= words
+        if kind == "document":
+            if not same_patient:
+                return None
+            reused.append(report)
+            continue
+        # a page subset keeps only the results found on its own pages, and the patient only
+        # if it is named there
+        tests = report.get("test_results")
+        if not isinstance(tests, list) or not tests:
+            return None
+        tests = [test for test in tests if isinstance(test, dict) and _on_one_line(test, lines)]
+        if tests:
+            reused.append(dict(report, test_results=tests,
+                               patient_info=report.get("patient_info") if same_patient else {}))
+    return reused or None
+
+class _Pending:
+    def __init__(self, name, extractor, signature):
+        self.name = name
+        self.extractor = extractor
+        self.signature = signature
+        self.future = Future()
+
+class SimilarityIndex:
+    def __init__(self, path=SIMILARITY_DB_PATH, threshold=DUPLICATE_THRESHOLD, max_documents=SIMILARITY_MAX_DOCUMENTS,
+                 wait_seconds=DUPLICATE_WAIT_SECONDS):
+        self.path = path
+        self.threshold = threshold
+        self.max_documents = max_documents
+        self.wait_seconds = wait_seconds
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._memory_connection = sqlite3.connect(path, check_same_thread=False) if path == ":memory:" else None
+        self._lock = threading.Lock()
+        self._pending = []
+        with self._transaction() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        if self._memory_connection is not None:
+            return self._memory_connection
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            if conn is not self._memory_connection:
+                conn.close()
+
+    def _compare(self, signature, candidate, candidate_pages):
+        if candidate.fingerprint == signature.fingerprint:
+            score = similarity(signature.minhash, candidate.minhash)
+            if score >= self.threshold:
+                return score, "document"
+        score = _page_subset_score(signature.pages, candidate_pages, self.threshold)
+        return (score, "pages") if score is not None else None
+
+    def find(self, signature, extractor):
+        keys = set(_band_keys(signature.minhash))
+        for page in signature.pages:
+            if page.minhash is not None:
+                keys.update(_band_keys(page.minhash))
+        keys = list(keys)
+        best = None
+        with self._transaction() as conn:
+            candidates = {}
+            # keys are looked up in slices that stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 900):
+                batch = keys[start:start + 900]
+                for row in conn.execute(
+                    f"SELECT DISTINCT d.id, d.name, d.minhash, d.fingerprint FROM bands b "
+                    f"JOIN documents d ON d.id = b.document_id "
+                    f"WHERE d.extractor = ? AND b.key IN ({','.join('?' * len(batch))})",
+                    [extractor] + batch
+                ):
+                    candidates[row[0]] = row
+            for document_id, name, blob, fingerprint in candidates.values():
+                pages = [PageSignature(None if page_blob is None else np.frombuffer(page_blob, dtype=np.uint32),
+                                       page_fingerprint)
+                         for page_blob, page_fingerprint in conn.execute(
+                             "SELECT minhash, fingerprint FROM pages WHERE document_id = ? ORDER BY id",
+                             (document_id,))]
+                candidate = PageSignature(np.frombuffer(blob, dtype=np.uint32), fingerprint)
+                found = self._compare(signature, candidate, pages)
+                if found is not None and (best is None or found[0] > best[0]):
+                    best = (found[0], found[1], document_id, name)
+            if best is None:
+                return None
+            reports = conn.execute("SELECT reports FROM documents WHERE id = ?", (best[2],)).fetchone()[0]
+        return Match(best[3], best[0], best[1], json.loads(reports))
+
+    def add(self, name, signature, extractor, reports):
+        with self._transaction() as conn:
+            document_id = conn.execute(
+                "INSERT INTO documents (extractor, name, minhash, fingerprint, reports, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (extractor, name, signature.minhash.tobytes(), signature.fingerprint,
+                 json.dumps(reports, ensure_ascii=False), time.time())
+            ).lastrowid
+            conn.executemany("INSERT INTO bands (key, document_id) VALUES (?, ?)",
+                             [(key, document_id) for key in _band_keys(signature.minhash)])
+            for page in signature.pages:
+                page_id = conn.execute("INSERT INTO pages (document_id, minhash, fingerprint) VALUES (?, ?, ?)",
+                                       (document_id, None if page.minhash is None else page.minhash.tobytes(),
+                                        page.fingerprint)).lastrowid
+                if page.minhash is None:
+                    continue
+                conn.executemany("INSERT INTO bands (key, document_id, page_id) VALUES (?, ?, ?)",
+                                 [(key, document_id, page_id) for key in _band_keys(page.minhash)])
+            # the oldest documents are forgotten once the index is full
+            conn.execute("DELETE FROM documents WHERE id IN (SELECT id FROM documents ORDER BY created_at DESC "
+                         "LIMIT -1 OFFSET ?)", (self.max_documents,))
+
+    def _find_pending(self, signature, extractor):
+        best = None
+        for pending in self._pending:
+            if pending.extractor != extractor:
+                continue
+            found = self._compare(signature, pending.signature, pending.signature.pages)
+            if found is not None and (best is None or found[0] > best[0]):
+                best = (found[0], found[1], pending)
+        return best
+
+    def reuse_or_compute(self, name, pages, extractor, compute):
+        document_signature = signature(pages)
+        if document_signature is None:
+            return compute(), None
+        text = "\n".join(pages)
+        with self._lock:
+            # copies within one upload wait for the first copy instead of calling the LLM in parallel
+            in_progress = self._find_pending(document_signature, extractor)
+            match = None if in_progress else self.find(document_signature, extractor)
+            reports = None if match is None else _reusable(match.kind, match.reports, text)
+            if reports is not None:
+                return reports, match
+            if in_progress is None:
+                pending = _Pending(name, extractor, document_signature)
+                self._pending.append(pending)
+        if in_progress is not None:
+            score, kind, original = in_progress
+            try:
+                original_reports = original.future.result(timeout=self.wait_seconds)
+            except Exception:
+                original_reports = None
+            reports = None if original_reports is None else _reusable(kind, original_reports, text)
+            if reports is not None:
+                return reports, Match(original.name, score, kind, None)
+            # the first copy failed, is still running or does not cover this one, so it is
+            # extracted on its own
+            return compute(), None
+        # waiting copies always get an answer: the reports, or None when there is nothing to reuse
+        reusable = None
+        try:
+            reports = compute()
+            # a cut-off answer is neither indexed nor handed to waiting copies
+            if isinstance(reports, list) and all(
+                    isinstance(report, dict) and (report.get("extraction") or {}).get("complete") is not False
+                    for report in reports):
+                try:
+                    self.add(name, document_signature, extractor, reports)
+                    reusable = reports
+                except Exception:
+                    # the index is only a shortcut; a locked or broken database must not fail the file
+                    logger.warning("could not index %s for near-duplicate detection", name, exc_info=True)
+        finally:
+            with self._lock:
+                self._pending.remove(pending)
+            pending.future.set_result(reusable)
+        return reports, None
+
+_lock = threading.Lock()
+_similarity_index = None
+
+def get_similarity_index():
+    global _similarity_index
+    with _lock:
+        if _similarity_index is None:
+            _similarity_index = SimilarityIndex()
+        return _similarity_index
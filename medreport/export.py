@@ -0,0 +1,176 @@
+import argparse
+import csv
+import importlib.util
+import io
+import json
+import math
+import os
+from contextlib import contextmanager
+from itertools import islice
+
+from .classify import get_report_type
+from .columns import STATUS_UNKNOWN, TestResultColumns
+from .merge import collection_date
+from .rules import BLOOD_GROUP, qualitative_status, urine_rules
+from .store import content_hash
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+FIELDS = ["report_id", "report_type", "collection_date", "patient_name", "patient_age", "patient_sex",
+          "test_name", "value", "numeric_value", "unit", "reference_range", "range_min", "range_max", "status"]
+FORMATS = ("ndjson", "csv", "parquet")
+
+def parquet_available():
+    return importlib.util.find_spec("pyarrow") is not None
+
+def report_id(report):
+    # the results store's content hash, so exported rows join against it
+    return content_hash(report)
+
+def _number(value):
+    return None if math.isnan(value) else float(value)
+
+def _text(value):
+    return "" if value is None else str(value).strip()
+
+def _rule_status(test_name, value, urine):
+    # urine reports are graded by parameter ("Color: Pale Yellow") as in the PDF, everything else
+    # by the name-independent rule only; results neither can grade are left blank
+    value = str(value or "").strip().lower()
+    if not value or BLOOD_GROUP.fullmatch(value):
+        return ""
+    status = urine_rules.evaluate(str(test_name or "").strip().lower(), value) if urine else None
+    return status or qualitative_status(value) or ""
+
+def iter_rows(reports, batch_size=EXPORT_BATCH_SIZE):
+    reports = iter(reports)
+    while True:
+        # value and range parsing and status are computed per batch of reports, so memory
+        # does not grow with the size of the export
+        batch = [report for report in islice(reports, batch_size) if report]
+        if not batch:
+            return
+        columns = TestResultColumns.from_reports(batch)
+        labels = columns.status_labels()
+        for i, report in enumerate(batch):
+            urine = get_report_type(report) == "urine"
+            patient_info = report.get("patient_info") or {}
+            shared = {
+                "report_id": report_id(report),
+                "report_type": _text(report.get("report_type")),
+                "collection_date": collection_date(report),
+                "patient_name": _text(patient_info.get("name")),
+                "patient_age": _text(patient_info.get("age")),
+                "patient_sex": _text(patient_info.get("sex")),
+            }
+            for j in range(columns.offsets[i], columns.offsets[i + 1]):
+                status = labels[j]
+                if columns.status[j] == STATUS_UNKNOWN:
+                    # results without a numeric range (negative, reactive, 2+, ...) are graded by rule
+                    status = _rule_status(columns.names[j], columns.raw_values[j], urine)
+                yield dict(shared,
+                           test_name=columns.names[j],
+                           value=columns.raw_values[j],
+                           numeric_value=_number(columns.values[j]),
+                           unit=columns.units[j],
+                           reference_range=columns.raw_ranges[j],
+                           range_min=_number(columns.range_min[j]),
+                           range_max=_number(columns.range_max[j]),
+                           status=status)
+
+@contextmanager
+def _open_output(output, mode):
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, mode, encoding=None if "b" in mode else "utf-8",
+                  newline=None if "b" in mode else "") as f:
+            yield f
+    else:
+        yield output
+
+def write_ndjson(reports, output, batch_size=EXPORT_BATCH_SIZE):
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    count = 0
+    with _open_output(output, "w") as f:
+        for row in iter_rows(reports, batch_size):
+            f.write(encode(row) + "\n")
+            count += 1
+    return count
+
+def write_csv(reports, output, batch_size=EXPORT_BATCH_SIZE):
+    count = 0
+    with _open_output(output, "w") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in iter_rows(reports, batch_size):
+            writer.writerow(row)
+            count += 1
+    return count
+
+def write_parquet(reports, output, batch_size=EXPORT_BATCH_SIZE):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([(field, pa.float64() if field in ("numeric_value", "range_min", "range_max") else pa.string())
+                        for field in FIELDS])
+    count = 0
+    with _open_output(output, "wb") as f, pq.ParquetWriter(f, schema) as writer:
+        rows = iter_rows(reports, batch_size)
+        while True:
+            # rows are written a record batch at a time, so only one batch is held in memory
+            batch = list(islice(rows, batch_size * 8))
+            if not batch:
+                break
+            writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+WRITERS = {"ndjson": write_ndjson, "csv": write_csv, "parquet": write_parquet}
+
+def format_for_path(path):
+    extension = os.path.splitext(str(path))[1].lower().lstrip(".")
+    return {"jsonl": "ndjson", "pq": "parquet"}.get(extension, extension)
+
+def export_test_results(reports, output, format=None, batch_size=EXPORT_BATCH_SIZE):
+    format = format or format_for_path(output)
+    if format not in WRITERS:
+        raise ValueError(f"Unknown export format {format!r}; expected one of {', '.join(FORMATS)}")
+    if format == "parquet" and not parquet_available():
+        raise ImportError("Parquet export needs the optional pyarrow package")
+    return WRITERS[format](reports, output, batch_size)
+
+def export_bytes(reports, format):
+    # in-memory variant for download buttons
+    if format == "parquet":
+        buffer = io.BytesIO()
+        export_test_results(reports, buffer, format)
+        return buffer.getvalue()
+    buffer = io.StringIO(newline="")
+    export_test_results(reports, buffer, format)
+    return buffer.getvalue().encode("utf-8")
+
+def iter_report_files(paths):
+    # accepts bulk-ingest outputs ({"reports": [...]}), lists of reports and single reports;
+    # directories are searched recursively and one file is loaded at a time
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path)
+                           for name in names if name.endswith(".json"))
+        else:
+            files = [path]
+        for file_path in files:
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict) and "reports" in data:
+                data = data["reports"]
+            yield from (data if isinstance(data, list) else [data])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export one row per test result from parsed report JSON files.")
+    parser.add_argument("inputs", nargs="+", help="report JSON files or directories of them (e.g. bulk-ingest output)")
+    parser.add_argument("--output", required=True, help="output file; the format follows the extension")
+    parser.add_argument("--format", choices=FORMATS)
+    args = parser.parse_args(argv)
+    count = export_test_results(iter_report_files(args.inputs), args.output, args.format)
+    print(f"wrote {count} rows to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from .llm import TABLE_FAST_PATH, get_scheduler, parse_document
+from .merge import extract_test_results, merge_reports
+from .metrics import metrics, with_current_file
+from .pdftext import extract_document
+from .pipeline import file_result
+from .scheduler import TaskResult
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.jsonl"
+INGEST_PROCESSES = int(os.getenv("INGEST_PROCESSES", str(os.cpu_count() or 1)))
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def iter_pdfs(source_dir):
+    for root, dirs, names in os.walk(source_dir):
+        dirs.sort()
+        for name in sorted(names):
+            if name.lower().endswith(".pdf"):
+                yield os.path.join(root, name)
+
+class Manifest:
+    # append-only JSON lines (content hash -> status, output); the last line for a hash wins,
+    # so a run killed mid-write loses at most the entry it was writing
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[entry["sha256"]] = entry
+        self._file = open(path, "a", encoding="utf-8")
+
+    def get(self, sha256):
+        return self.entries.get(sha256)
+
+    def record(self, sha256, source, status, output=None, error=None):
+        entry = {"sha256": sha256, "source": source, "status": status, "output": output, "error": error,
+                 "updated_at": time.time()}
+        self.entries[sha256] = entry
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(temp_path, path)
+
+def ingest(source_dir, output_dir, processes=INGEST_PROCESSES, chunked=False, retry_failed=True, scheduler=None):
+    scheduler = scheduler or get_scheduler()
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME))
+    counts = {"done": 0, "failed": 0, "skipped": 0}
+    pending = []
+    for path in iter_pdfs(source_dir):
+        sha256 = file_sha256(path)
+        entry = manifest.get(sha256)
+        if entry and (entry["status"] == "done" or (entry["status"] == "failed" and not retry_failed)):
+            counts["skipped"] += 1
+            continue
+        pending.append((path, sha256))
+    logger.info("%d PDFs to process, %d already in the manifest", len(pending), counts["skipped"])
+    processes = max(1, processes)
+    # only this many files are extracted or waiting on the LLM at once, so memory stays flat
+    # however large the archive is
+    window = processes + scheduler.max_concurrency * 2
+    work = iter(pending)
+    in_flight = {}
+
+    def finish(path, sha256, document, reports, error):
+        source = os.path.relpath(path, source_dir)
+        result = file_result(TaskResult(path, document, reports, error), chunked)
+        if result.failed:
+            manifest.record(sha256, source, "failed", error=result.messages[-1][1])
+            counts["failed"] += 1
+            logger.warning("failed %s: %s", source, result.messages[-1][1])
+            return
+        output = os.path.join(output_dir, os.path.splitext(source)[0] + ".json")
+        _write_json(output, {
+            "source": source,
+            "sha256": sha256,
+            "messages": [{"level": level, "message": message} for level, message in result.messages],
+            "test_results": extract_test_results(result.reports),
+            "reports": merge_reports(result.reports),
+        })
+        manifest.record(sha256, source, "done", output=os.path.relpath(output, output_dir))
+        counts["done"] += 1
+        logger.info("[%d/%d] %s", counts["done"] + counts["failed"], len(pending), source)
+
+    try:
+        # text extraction is CPU-bound and runs in processes; LLM calls are I/O-bound and run in
+        # threads, bounded by the scheduler's concurrency and rate limits
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as extract_pool, \
+             ThreadPoolExecutor(max_workers=scheduler.max_concurrency) as llm_pool:
+            while True:
+                while len(in_flight) < window:
+                    item = next(work, None)
+                    if item is None:
+                        break
+                    # each process handles a whole file, so the per-document page pool is not used
+                    future = extract_pool.submit(extract_document, item[0], False, TABLE_FAST_PATH and not chunked)
+                    in_flight[future] = ("extract", item, None)
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, (path, sha256), document = in_flight.pop(future)
+                    if future.exception() is not None:
+                        finish(path, sha256, document, None, future.exception())
+                    elif kind == "extract":
+                        document = future.result()
+                        parse = llm_pool.submit(with_current_file, os.path.basename(path), parse_document,
+                                                document, chunked, scheduler)
+                        in_flight[parse] = ("parse", (path, sha256), document)
+                    else:
+                        finish(path, sha256, document, future.result(), None)
+    finally:
+        manifest.close()
+        metrics.export()
+    logger.info("%d done, %d failed, %d skipped", counts["done"], counts["failed"], counts["skipped"])
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parse every PDF under a directory, resuming where the last run stopped.")
+    parser.add_argument("source", help="directory searched recursively for PDFs")
+    parser.add_argument("output", help="directory for the per-file JSON and the manifest")
+    parser.add_argument("--processes", type=int, default=INGEST_PROCESSES, help="text extraction processes")
+    parser.add_argument("--chunked", action="store_true", help="extract long reports in chunks instead of truncating")
+    parser.add_argument("--skip-failed", action="store_true", help="do not retry files that failed in an earlier run")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    try:
+        counts = ingest(args.source, args.output, args.processes, args.chunked, not args.skip_failed)
+    except KeyboardInterrupt:
+        logger.warning("interrupted; run the same command again to resume")
+        return 130
+    return 1 if counts["failed"] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,306 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from .scheduler import DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
+
+DATA_DIR = os.path.join(os.path.expanduser("~"), ".local", "share", "medical-report-parser")
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(DATA_DIR, "jobs.db"))
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(DATA_DIR, "jobs"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(os.cpu_count() or 1)))
+JOB_QUEUE_ENABLED = os.getenv("JOB_QUEUE", "0") == "1"
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+# a file claimed by a worker that has not reported back within this many seconds is handed out again
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "600"))
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    status TEXT NOT NULL,
+    chunked INTEGER NOT NULL,
+    file_count INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    result_json TEXT,
+    pdf_path TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS job_files (
+    id INTEGER PRIMARY KEY,
+    job_id INTEGER NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    result_json TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_job_files_status ON job_files(status, id);
+CREATE INDEX IF NOT EXISTS idx_job_files_job ON job_files(job_id, position);
+"""
+
+UNFINISHED = ("queued", "running")
+
+class JobQueue:
+    def __init__(self, path=JOBS_DB_PATH, jobs_dir=JOBS_DIR, lease_seconds=JOB_LEASE_SECONDS):
+        self.path = path
+        self.jobs_dir = jobs_dir
+        self.lease_seconds = lease_seconds
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        os.makedirs(jobs_dir, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # autocommit mode: transactions are opened explicitly so claims can take the write lock up front
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def _transaction(self, immediate=False):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def submit(self, files, chunked=False):
+        from .pipeline import safe_filename
+        now = time.time()
+        files = list(files)
+        with self._transaction(immediate=True) as conn:
+            job_id = conn.execute(
+                "INSERT INTO jobs (status, chunked, file_count, created_at, updated_at) VALUES ('queued', ?, ?, ?, ?)",
+                (int(chunked), len(files), now, now)
+            ).lastrowid
+            job_dir = os.path.join(self.jobs_dir, str(job_id))
+            os.makedirs(job_dir, exist_ok=True)
+            rows = []
+            for position, source in enumerate(files):
+                name = getattr(source, "name", None) or (os.path.basename(source) if isinstance(source, str)
+                                                         else f"document_{position}.pdf")
+                path = os.path.join(job_dir, f"{position:04d}_{safe_filename(name)}")
+                # uploads are copied to disk so the job survives the browser session and the UI process
+                if isinstance(source, (str, os.PathLike)):
+                    shutil.copyfile(source, path)
+                else:
+                    source.seek(0)
+                    with open(path, "wb") as f:
+                        shutil.copyfileobj(source, f, 1024 * 1024)
+                rows.append((job_id, position, name, path, "queued", now))
+            conn.executemany(
+                "INSERT INTO job_files (job_id, position, name, path, status, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return job_id
+
+    def claim(self):
+        now = time.time()
+        stale = now - self.lease_seconds
+        with self._transaction(immediate=True) as conn:
+            # a job whose finalizing worker died is picked up again like any other stale claim
+            job = conn.execute("SELECT id FROM jobs WHERE status = 'finalizing' AND updated_at < ? "
+                               "ORDER BY id LIMIT 1", (stale,)).fetchone()
+            if job is not None:
+                conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (now, job["id"]))
+                return {"job_id": job["id"], "finalize": True}
+            while True:
+                row = conn.execute(
+                    "SELECT f.id, f.job_id, f.name, f.path, f.attempts, j.chunked FROM job_files f "
+                    "JOIN jobs j ON j.id = f.job_id "
+                    "WHERE f.status = 'queued' OR (f.status = 'running' AND f.updated_at < ?) "
+                    "ORDER BY f.id LIMIT 1",
+                    (stale,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row["attempts"] < MAX_ATTEMPTS:
+                    break
+                # a file that keeps killing its worker is failed instead of handed out forever
+                result = {"reports": [], "messages": [["error", "Error processing file: worker stopped repeatedly"]],
+                          "failed": True}
+                conn.execute("UPDATE job_files SET status = 'failed', result_json = ?, updated_at = ? WHERE id = ?",
+                             (json.dumps(result), now, row["id"]))
+                if self.claim_finalization(row["job_id"], conn) is not None:
+                    return {"job_id": row["job_id"], "finalize": True}
+            conn.execute("UPDATE job_files SET status = 'running', attempts = attempts + 1, updated_at = ? "
+                         "WHERE id = ?", (now, row["id"]))
+            conn.execute("UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'queued'",
+                         (now, row["job_id"]))
+            return dict(row, finalize=False)
+
+    def complete_file(self, file_id, file_result):
+        now = time.time()
+        status = "failed" if file_result.failed else "done"
+        with self._transaction(immediate=True) as conn:
+            conn.execute("UPDATE job_files SET status = ?, result_json = ?, updated_at = ? WHERE id = ?",
+                         (status, json.dumps(file_result._asdict()), now, file_id))
+            job_id = conn.execute("SELECT job_id FROM job_files WHERE id = ?", (file_id,)).fetchone()[0]
+            return self.claim_finalization(job_id, conn)
+
+    def claim_finalization(self, job_id, conn):
+        # exactly one worker wins the switch to 'finalizing' once the last file is finished
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'finalizing', updated_at = ? WHERE id = ? AND status IN ('queued', 'running') "
+            "AND NOT EXISTS (SELECT 1 FROM job_files WHERE job_id = ? AND status IN ('queued', 'running'))",
+            (time.time(), job_id, job_id)
+        )
+        return job_id if cursor.rowcount else None
+
+    def file_results(self, job_id):
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT result_json FROM job_files WHERE job_id = ? ORDER BY position",
+                                (job_id,)).fetchall()
+        return [json.loads(row["result_json"]) if row["result_json"] else None for row in rows]
+
+    def finalize(self, job_id):
+        from .pipeline import final_reports
+        from .render import generate_pdf
+        results = self.file_results(job_id)
+        all_reports = [report for result in results if result for report in result["reports"]]
+        try:
+            reports = final_reports(all_reports, len(results))
+            pdf_path = os.path.join(self.jobs_dir, str(job_id), "final_report.pdf")
+            # finalization runs inside a job worker, which may not start a render pool of its own
+            generate_pdf(reports, pdf_path, workers=1)
+        except Exception as exc:
+            with self._transaction(immediate=True) as conn:
+                conn.execute("UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                             (str(exc), time.time(), job_id))
+            return
+        with self._transaction(immediate=True) as conn:
+            conn.execute("UPDATE jobs SET status = 'done', result_json = ?, pdf_path = ?, updated_at = ? WHERE id = ?",
+                         (json.dumps(reports), pdf_path, time.time(), job_id))
+
+    def status(self, job_id):
+        with self._transaction() as conn:
+            job = conn.execute("SELECT id, status, file_count, error FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            files = conn.execute("SELECT name, status FROM job_files WHERE job_id = ? ORDER BY position",
+                                 (job_id,)).fetchall()
+        status = dict(job)
+        status["files"] = [dict(row) for row in files]
+        status["finished"] = sum(1 for row in files if row["status"] not in UNFINISHED)
+        return status
+
+    def result(self, job_id):
+        with self._transaction() as conn:
+            job = conn.execute("SELECT status, result_json, pdf_path, error FROM jobs WHERE id = ?",
+                               (job_id,)).fetchone()
+        if job is None or job["status"] not in ("done", "failed"):
+            return None
+        return {"status": job["status"], "reports": json.loads(job["result_json"] or "[]"),
+                "pdf_path": job["pdf_path"], "error": job["error"], "files": self.file_results(job_id)}
+
+    def delete(self, job_id):
+        with self._transaction(immediate=True) as conn:
+            conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        shutil.rmtree(os.path.join(self.jobs_dir, str(job_id)), ignore_errors=True)
+
+def run_worker(db_path=JOBS_DB_PATH, jobs_dir=JOBS_DIR, processes=1, stop_event=None, poll_interval=0.5):
+    from .llm import MAX_TEXT_LENGTH
+    from .pipeline import file_result, parse_files
+    from .scheduler import ExtractionScheduler, RateLimiter, estimate_tokens
+    job_queue = JobQueue(db_path, jobs_dir)
+    processes = max(1, processes)
+    # every worker process gets an equal share of the account's rate limits
+    scheduler = ExtractionScheduler(
+        rate_limiter=RateLimiter(
+            max(1, DEFAULT_REQUESTS_PER_MINUTE // processes) if DEFAULT_REQUESTS_PER_MINUTE else 0,
+            max(1, DEFAULT_TOKENS_PER_MINUTE // processes) if DEFAULT_TOKENS_PER_MINUTE else 0
+        ),
+        token_estimator=lambda text: estimate_tokens(text[:MAX_TEXT_LENGTH])
+    )
+    while stop_event is None or not stop_event.is_set():
+        item = job_queue.claim()
+        if item is None:
+            time.sleep(poll_interval)
+            continue
+        if item["finalize"]:
+            job_queue.finalize(item["job_id"])
+            continue
+        chunked = bool(item["chunked"])
+        # workers are daemon processes and cannot start the page pool; the worker pool already
+        # spreads files over the CPUs
+        result = parse_files([item["path"]], chunked, scheduler, use_pool=False)[0]
+        job_id = job_queue.complete_file(item["id"], file_result(result, chunked))
+        if job_id is not None:
+            job_queue.finalize(job_id)
+
+class WorkerPool:
+    def __init__(self, processes=JOB_WORKERS, db_path=JOBS_DB_PATH, jobs_dir=JOBS_DIR):
+        self.processes = max(1, processes)
+        self.db_path = db_path
+        self.jobs_dir = jobs_dir
+        context = multiprocessing.get_context("spawn")
+        self._stop = context.Event()
+        self._workers = [
+            context.Process(target=run_worker, args=(db_path, jobs_dir, self.processes, self._stop), daemon=True)
+            for _ in range(self.processes)
+        ]
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+        return self
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        for worker in self._workers:
+            worker.join(timeout)
+
+_lock = threading.Lock()
+_job_queue = None
+_worker_pool = None
+
+def get_job_queue():
+    global _job_queue
+    with _lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
+
+def ensure_workers(processes=JOB_WORKERS):
+    global _worker_pool
+    with _lock:
+        if _worker_pool is None:
+            _worker_pool = WorkerPool(processes).start()
+        return _worker_pool
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run background workers for the report job queue.")
+    parser.add_argument("--processes", type=int, default=JOB_WORKERS)
+    parser.add_argument("--db", default=JOBS_DB_PATH)
+    parser.add_argument("--jobs-dir", default=JOBS_DIR)
+    args = parser.parse_args(argv)
+    pool = WorkerPool(args.processes, args.db, args.jobs_dir).start()
+    print(f"{args.processes} workers processing jobs from {args.db}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
+
+if __name__ == "__main__":
+    main()
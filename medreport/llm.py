@@ -0,0 +1,191 @@
+import copy
+import json
+import os
+import threading
+
+from .backends import create_backend
+from .cache import ExtractionCache, make_cache_key
+from .chunking import extract_chunked
+from .compaction import iter_compacted
+from .dedup import NEAR_DUPLICATES_ENABLED, get_similarity_index
+from .metrics import current_file, metrics, stage
+from .scheduler import ExtractionScheduler, estimate_tokens
+from .streaming import IncrementalReportParser, is_report_list, replay_events
+from .tables import MIN_CONFIDENCE, extract_from_tables
+
+MODEL_NAME = os.getenv("LLM_MODEL", "llama3-8b-8192")
+MAX_TEXT_LENGTH = 2500
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "truncate")
+TABLE_FAST_PATH = os.getenv("TABLE_FAST_PATH", "1") == "1"
+PROMPT_COMPACTION = os.getenv("PROMPT_COMPACTION", "1") == "1"
+LLM_STREAMING = os.getenv("LLM_STREAMING", "1") == "1"
+SYSTEM_PROMPT = """Extract structured medical data as JSON with schema:
+{
+  "patient_info": {"name": string, "age": number, "sex": string},
+  "report_type": string,
+  "collection_date": string,
+  "test_results": [{"test_name": string, "value": string, "unit": string, "reference_range": string}],
+  "doctor_notes": string
+  "summary" : string
+}
+
+For blood/urine tests: Include parameters, values, units, ranges.
+For imaging/pathology: Include findings, impressions, specimen details, diagnosis."""
+
+_lock = threading.Lock()
+_llm_backend = None
+_extraction_cache = None
+_llm_scheduler = None
+
+def get_backend():
+    global _llm_backend
+    with _lock:
+        if _llm_backend is None:
+            _llm_backend = create_backend()
+        return _llm_backend
+
+def set_backend(backend):
+    global _llm_backend
+    with _lock:
+        _llm_backend = backend
+
+def get_extraction_cache():
+    global _extraction_cache
+    with _lock:
+        if _extraction_cache is None:
+            _extraction_cache = ExtractionCache()
+        return _extraction_cache
+
+def get_scheduler():
+    global _llm_scheduler
+    with _lock:
+        if _llm_scheduler is None:
+            _llm_scheduler = ExtractionScheduler(
+                token_estimator=lambda text: estimate_tokens(text[:MAX_TEXT_LENGTH])
+            )
+        return _llm_scheduler
+
+def is_api_error(exc):
+    return getattr(exc, "status_code", None) is not None
+
+def user_prompt(pdf_text):
+    return f"Parse this medical report into structured JSON:\n\n{pdf_text}"
+
+def call_llm(pdf_text):
+    with stage("llm_request"):
+        completion = get_backend().complete(SYSTEM_PROMPT, user_prompt(pdf_text), MODEL_NAME)
+    metrics.add_usage(completion.usage)
+    with stage("json_parse"):
+        parsed_data = json.loads(completion.content)
+    if isinstance(parsed_data, dict):
+        parsed_data = [parsed_data]
+    if not is_report_list(parsed_data):
+        # raised before the extraction cache stores it, so a bad answer is asked again next time
+        raise ValueError("The model's response did not contain a report")
+    return parsed_data
+
+def _scheduled(function, scheduler):
+    return function if scheduler is None else (lambda text: scheduler.call_llm(function, text))
+
+def parse_report_text(pdf_text, scheduler=None):
+    call = _scheduled(call_llm, scheduler)
+    computed = []
+    def compute(text):
+        computed.append(True)
+        return call(text)
+    result = get_extraction_cache().get_or_compute(pdf_text, SYSTEM_PROMPT, MODEL_NAME, compute)
+    metrics.increment("cache_misses" if computed else "cache_hits")
+    return result
+
+def stream_report_text(pdf_text, on_event, scheduler=None):
+    cache = get_extraction_cache()
+    key = make_cache_key(pdf_text, SYSTEM_PROMPT, MODEL_NAME)
+    cached = cache.get(key)
+    # entries written before answers were checked may hold a stray preamble value such as [1]
+    if is_report_list(cached):
+        metrics.increment("cache_hits")
+        for event in replay_events(cached):
+            on_event(event)
+        return cached
+    metrics.increment("cache_misses")
+    attempt = {}
+
+    def run(text):
+        # a fresh parser per attempt: the scheduler may retry a call that was rate limited
+        parser = attempt["parser"] = IncrementalReportParser()
+        with stage("llm_request"):
+            for delta in get_backend().stream(SYSTEM_PROMPT, user_prompt(text), MODEL_NAME,
+                                              on_usage=metrics.add_usage):
+                for event in parser.feed(delta):
+                    on_event(event)
+
+    try:
+        _scheduled(run, scheduler)(pdf_text)
+    except Exception:
+        parser = attempt.get("parser")
+        if parser is None or not parser.finish():
+            raise
+    parser = attempt["parser"]
+    reports = parser.finish()
+    if not is_report_list(reports):
+        # the stream held no parsable report (prose around a stray bracket, an empty answer), so
+        # ask again without streaming, where JSON mode applies
+        metrics.increment("llm_stream_fallbacks")
+        reports = _scheduled(call_llm, scheduler)(pdf_text)
+        cache.put(key, reports)
+        for event in replay_events(reports):
+            on_event(event)
+        return reports
+    if parser.complete:
+        cache.put(key, reports)
+    else:
+        # keep what arrived before the stream broke off, but never cache a partial answer
+        metrics.increment("llm_truncated_streams")
+        for report in reports:
+            report["extraction"] = {"method": "llm", "complete": False}
+    return reports
+
+def prepare_pages(pages, record=True):
+    return iter_compacted(pages, record) if PROMPT_COMPACTION else pages
+
+def prompt_text(pages):
+    return "\n".join(prepare_pages(pages, record=False))
+
+def parse_report_pages(pages, chunked=False, scheduler=None, on_event=None):
+    pages = prepare_pages(pages)
+    if chunked:
+        # chunks are merged after they all return, so they are not streamed
+        return extract_chunked(pages, lambda text: parse_report_text(text, scheduler), MAX_TEXT_LENGTH)
+    pdf_text = "\n".join(pages)[:MAX_TEXT_LENGTH]
+    if on_event is not None:
+        return stream_report_text(pdf_text, on_event, scheduler)
+    return parse_report_text(pdf_text, scheduler)
+
+def parse_document(document, chunked=False, scheduler=None, min_confidence=MIN_CONFIDENCE, on_event=None):
+    if document.tables:
+        with stage("table_parse"):
+            fast = extract_from_tables(document.tables, "\n".join(document.pages[:1]))
+        if fast.confidence >= min_confidence:
+            if on_event is not None:
+                for event in replay_events([fast.report]):
+                    on_event(event)
+            return [fast.report]
+    if not NEAR_DUPLICATES_ENABLED:
+        return parse_report_pages(document.pages, chunked, scheduler, on_event)
+    # rescans, re-exports and page subsets of a document seen before reuse its extraction
+    extractor = make_cache_key(f"chunked={bool(chunked)}", SYSTEM_PROMPT, MODEL_NAME)
+    reports, match = get_similarity_index().reuse_or_compute(
+        current_file.get(), document.pages, extractor,
+        lambda: parse_report_pages(document.pages, chunked, scheduler, on_event)
+    )
+    if match is None:
+        return reports
+    metrics.increment("near_duplicates")
+    reports = copy.deepcopy(reports)
+    for report in reports:
+        report["extraction"] = {"method": "duplicate", "source": match.name,
+                                "similarity": round(match.similarity, 3), "match": match.kind}
+    if on_event is not None:
+        for event in replay_events(reports):
+            on_event(event)
+    return reports
@@ -0,0 +1,177 @@
+import copy
+import re
+from datetime import datetime
+
+def extract_test_results(reports, format_type="dict"):
+    results = {}
+    if not isinstance(reports, list):
+        reports = [reports]
+    for report in reports:
+        if not report or "test_results" not in report:
+            continue
+        for test in report.get("test_results", []):
+            test_name = test.get("test_name", "").strip()
+            if not test_name:
+                continue
+            value_raw = test.get("value", "")
+            value = str(value_raw).strip() if not isinstance(value_raw, float) else str(value_raw)
+            unit = test.get("unit", "")
+            if unit:
+                value = f"{value} {unit}"
+            results[test_name] = value
+    if format_type.lower() == "json":
+        import json
+        return json.dumps(results, indent=2)
+    return results
+
+DATE_FORMATS = ["%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%m/%d/%Y", "%d/%m/%y", "%d-%b-%Y",
+                "%d %b %Y", "%d %B %Y", "%b %d, %Y", "%B %d, %Y"]
+NAME_TITLES = re.compile(r'^(mr|mrs|ms|miss|dr|master|baby)\.?\s+')
+ANONYMOUS = ""
+
+def _normalize(value):
+    return re.sub(r'\s+', ' ', str(value or "")).strip().lower()
+
+def normalize_test_name(test_name):
+    return _normalize(test_name)
+
+def normalize_patient(patient_info):
+    return NAME_TITLES.sub("", _normalize((patient_info or {}).get("name")))
+
+def normalize_date(value):
+    raw = str(value or "").strip()
+    if not raw:
+        return ""
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(raw, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return raw
+
+def collection_date(report):
+    for field in ("collection_date", "report_date", "date"):
+        if report.get(field):
+            return normalize_date(report[field])
+    return ""
+
+class MergeIndex:
+    def __init__(self):
+        self._patients = {}
+        self._tests = {}
+        self._observations = set()
+        self.report_count = 0
+
+    def _patient_entry(self, key):
+        entry = self._patients.get(key)
+        if entry is None:
+            entry = self._patients[key] = {
+                "patient_info": {},
+                "report_type": "combined",
+                "test_results": [],
+                "doctor_notes": ""
+            }
+        return entry
+
+    def _resolve_patient(self, report):
+        # unnamed reports are kept apart; results() only attributes them when one patient is known
+        return normalize_patient(report.get("patient_info")) or ANONYMOUS
+
+    def add(self, report):
+        if not report:
+            return
+        self.report_count += 1
+        patient = self._resolve_patient(report)
+        merged = self._patient_entry(patient)
+        for field, value in (report.get("patient_info") or {}).items():
+            if value not in (None, "") and merged["patient_info"].get(field) in (None, ""):
+                merged["patient_info"][field] = value
+        if report.get("doctor_notes"):
+            report_type = report.get("report_type", "Unknown")
+            note = f"[{report_type.upper()} REPORT] {report['doctor_notes']}"
+            merged["doctor_notes"] = f"{merged['doctor_notes']}\n\n{note}" if merged["doctor_notes"] else note
+        date = collection_date(report)
+        for test in report.get("test_results", []):
+            test_name = normalize_test_name(test.get("test_name"))
+            if not test_name:
+                continue
+            observation = (patient, test_name, date, _normalize(test.get("value")), _normalize(test.get("unit")))
+            if observation in self._observations:
+                continue
+            self._observations.add(observation)
+            point = {
+                "value": test.get("value"),
+                "unit": test.get("unit"),
+                "reference_range": test.get("reference_range"),
+                "collection_date": date,
+                "report_type": report.get("report_type"),
+            }
+            entry = self._tests.get((patient, test_name))
+            if entry is None:
+                entry = dict(test)
+                if date:
+                    entry["collection_date"] = date
+                entry["history"] = [point]
+                self._tests[(patient, test_name)] = entry
+                merged["test_results"].append(entry)
+                continue
+            _insert_point(entry["history"], point)
+            if date and date > (entry.get("collection_date") or ""):
+                entry.update({k: v for k, v in test.items() if k != "test_name"})
+                entry["collection_date"] = date
+
+    def add_many(self, reports):
+        for report in reports:
+            self.add(report)
+        return self
+
+    def results(self):
+        anonymous = self._patients.get(ANONYMOUS)
+        named = [key for key in self._patients if key != ANONYMOUS]
+        if anonymous is None or len(named) != 1:
+            return list(self._patients.values())
+        return [_fold_into(self._patients[named[0]], anonymous)]
+
+def _insert_point(history, point):
+    # keep history ordered by date; undated results sort first and never displace a dated one
+    date = point["collection_date"]
+    position = len(history)
+    while position > 0 and (history[position - 1]["collection_date"] or "") > date:
+        position -= 1
+    history.insert(position, point)
+
+def _fold_into(target, source):
+    # copies, so the index itself stays correct when more patients are added later
+    merged = copy.deepcopy(target)
+    for field, value in source["patient_info"].items():
+        if value not in (None, "") and merged["patient_info"].get(field) in (None, ""):
+            merged["patient_info"][field] = value
+    if source["doctor_notes"]:
+        merged["doctor_notes"] = "\n\n".join(note for note in (merged["doctor_notes"], source["doctor_notes"]) if note)
+    tests = {normalize_test_name(test.get("test_name")): test for test in merged["test_results"]}
+    for test in copy.deepcopy(source["test_results"]):
+        name = normalize_test_name(test.get("test_name"))
+        entry = tests.get(name)
+        if entry is None:
+            tests[name] = test
+            merged["test_results"].append(test)
+            continue
+        seen = {(point["collection_date"], _normalize(point["value"]), _normalize(point["unit"]))
+                for point in entry["history"]}
+        for point in test["history"]:
+            observation = (point["collection_date"], _normalize(point["value"]), _normalize(point["unit"]))
+            if observation not in seen:
+                seen.add(observation)
+                _insert_point(entry["history"], point)
+        if (test.get("collection_date") or "") > (entry.get("collection_date") or ""):
+            entry.update({k: v for k, v in test.items() if k not in ("test_name", "history")})
+    return merged
+
+def merge_reports(reports, index=None):
+    if index is None:
+        if not reports:
+            return []
+        if len(reports) == 1:
+            return reports
+        index = MergeIndex()
+    return index.add_many(reports).results()
@@ -0,0 +1,199 @@
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+METRICS_JSONL_FILE = os.getenv("METRICS_JSONL_FILE", "")
+METRICS_PROMETHEUS_FILE = os.getenv("METRICS_PROMETHEUS_FILE", "")
+PROFILE_MODE = os.getenv("PROFILE_MODE", "")
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", ".")
+# per-file timings kept for the most recent files only; per-stage totals are never dropped
+METRICS_MAX_FILES = int(os.getenv("METRICS_MAX_FILES", "1000"))
+
+# set per document by ExtractionScheduler.map and copied into worker threads,
+# so stage timings can be attributed to the file they belong to
+current_file = contextvars.ContextVar("current_file", default=None)
+
+class Metrics:
+    def __init__(self, jsonl_file=METRICS_JSONL_FILE, prometheus_file=METRICS_PROMETHEUS_FILE,
+                 max_files=METRICS_MAX_FILES):
+        self.jsonl_file = jsonl_file
+        self.prometheus_file = prometheus_file
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._stages = defaultdict(lambda: [0, 0.0, 0.0])
+        self._files = OrderedDict()
+        self._counters = defaultdict(int)
+
+    def record(self, stage, wall, cpu, file=None):
+        if file is None:
+            file = current_file.get()
+        with self._lock:
+            for totals in (self._stages[stage], self._file_stages(file)[stage] if file is not None else None):
+                if totals is None:
+                    continue
+                totals[0] += 1
+                totals[1] += wall
+                totals[2] += cpu
+            if self.jsonl_file:
+                self._append({"time": time.time(), "stage": stage, "file": file, "wall_seconds": round(wall, 6),
+                              "cpu_seconds": round(cpu, 6)})
+
+    def _file_stages(self, file):
+        stages = self._files.get(file)
+        if stages is None:
+            stages = self._files[file] = defaultdict(lambda: [0, 0.0, 0.0])
+            # long-running services and workers see an unbounded stream of files
+            while len(self._files) > self.max_files:
+                self._files.popitem(last=False)
+        else:
+            self._files.move_to_end(file)
+        return stages
+
+    def increment(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] += amount
+            if self.jsonl_file:
+                self._append({"time": time.time(), "counter": counter, "amount": amount,
+                              "file": current_file.get()})
+
+    def add_usage(self, usage):
+        if usage is None:
+            return
+        self.increment("llm_prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+        self.increment("llm_completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+
+    def _append(self, event):
+        with open(self.jsonl_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event) + "\n")
+
+    @contextmanager
+    def stage(self, name, file=None):
+        wall_start = time.perf_counter()
+        # thread CPU time: stages run concurrently in pools, process time would mix them
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - wall_start, time.thread_time() - cpu_start, file)
+
+    def timed_iter(self, name, iterable):
+        iterator = iter(iterable)
+        while True:
+            wall_start = time.perf_counter()
+            cpu_start = time.thread_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.record(name, time.perf_counter() - wall_start, time.thread_time() - cpu_start)
+            yield item
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "stages": {stage: {"calls": calls, "wall_seconds": wall, "cpu_seconds": cpu}
+                           for stage, (calls, wall, cpu) in self._stages.items()},
+                "files": {file: {stage: {"calls": calls, "wall_seconds": wall, "cpu_seconds": cpu}
+                                 for stage, (calls, wall, cpu) in stages.items()}
+                          for file, stages in self._files.items()},
+                "counters": dict(self._counters),
+            }
+
+    def file_summary(self, file):
+        return self.snapshot()["files"].get(file, {})
+
+    def prometheus_text(self):
+        data = self.snapshot()
+        lines = [
+            "# HELP medreport_stage_calls_total Number of times a pipeline stage ran.",
+            "# TYPE medreport_stage_calls_total counter",
+        ]
+        lines += [f'medreport_stage_calls_total{{stage="{stage}"}} {totals["calls"]}'
+                  for stage, totals in sorted(data["stages"].items())]
+        lines += [
+            "# HELP medreport_stage_seconds_total Wall-clock seconds spent in a pipeline stage.",
+            "# TYPE medreport_stage_seconds_total counter",
+        ]
+        lines += [f'medreport_stage_seconds_total{{stage="{stage}"}} {totals["wall_seconds"]:.6f}'
+                  for stage, totals in sorted(data["stages"].items())]
+        lines += [
+            "# HELP medreport_stage_cpu_seconds_total CPU seconds spent in a pipeline stage.",
+            "# TYPE medreport_stage_cpu_seconds_total counter",
+        ]
+        lines += [f'medreport_stage_cpu_seconds_total{{stage="{stage}"}} {totals["cpu_seconds"]:.6f}'
+                  for stage, totals in sorted(data["stages"].items())]
+        for counter, value in sorted(data["counters"].items()):
+            lines += [f"# TYPE medreport_{counter}_total counter", f"medreport_{counter}_total {value}"]
+        return "\n".join(lines) + "\n"
+
+    def export(self, path=None):
+        path = path or self.prometheus_file
+        if not path:
+            return None
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # write-then-rename so a scraper never reads a half-written file
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+        return path
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._files.clear()
+            self._counters.clear()
+
+metrics = Metrics()
+
+def stage(name, file=None):
+    return metrics.stage(name, file)
+
+def with_current_file(file, fn, *args):
+    token = current_file.set(file)
+    try:
+        return fn(*args)
+    finally:
+        current_file.reset(token)
+
+@contextmanager
+def profile_run(mode=None, output_dir=None, label="run"):
+    mode = PROFILE_MODE if mode is None else mode
+    output_dir = output_dir or PROFILE_OUTPUT_DIR
+    if not mode:
+        yield None
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    if mode == "cprofile":
+        import cProfile
+        # cProfile only follows the calling thread; worker pool time shows up as waits
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(output_dir, f"{label}-{stamp}.prof"))
+    elif mode == "tracemalloc":
+        import tracemalloc
+        tracemalloc.start(25)
+        try:
+            yield tracemalloc
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(os.path.join(output_dir, f"{label}-{stamp}.tracemalloc.txt"), "w", encoding="utf-8") as f:
+                f.write(f"current_bytes {current}\npeak_bytes {peak}\n\n")
+                for stat in snapshot.statistics("lineno")[:50]:
+                    f.write(f"{stat}\n")
+    else:
+        raise ValueError(f"Unknown PROFILE_MODE {mode!r}; expected 'cprofile' or 'tracemalloc'")
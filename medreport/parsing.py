@@ -0,0 +1,37 @@
+import re
+
+def parse_value_with_units(value_str):
+    if not value_str:
+        return None
+    clean_str = value_str.replace(",", "")
+    match = re.search(r'(\d+\.?\d*)', clean_str)
+    if match:
+        try:
+            return float(match.group(1))
+        except:
+            return None
+    return None
+
+def parse_range(range_str):
+    if not range_str:
+        return None, None
+    if range_str.startswith('<'):
+        try:
+            max_val = parse_value_with_units(range_str[1:].strip())
+            return 0, max_val
+        except:
+            return None, None
+    elif range_str.startswith('>'):
+        try:
+            min_val = parse_value_with_units(range_str[1:].strip())
+            return min_val, min_val * 2
+        except:
+            return None, None
+    range_str = range_str.replace("–", "-").replace("—", "-").replace(" - ", "-")
+    if "-" in range_str:
+        parts = range_str.split("-")
+        if len(parts) >= 2:
+            min_val = parse_value_with_units(parts[0].strip())
+            max_val = parse_value_with_units(parts[1].strip())
+            return min_val, max_val
+    return None, None
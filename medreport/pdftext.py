@@ -0,0 +1,221 @@
+import gc
+import io
+import mmap
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from .metrics import metrics
+
+POOL_MIN_PAGES = int(os.getenv("PDF_POOL_MIN_PAGES", "24"))
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+POOL_PROCESSES = int(os.getenv("PDF_POOL_PROCESSES", str(os.cpu_count() or 1)))
+# uploads at least this large are spilled to a temp file and read through mmap in page windows
+SPOOL_MIN_BYTES = int(os.getenv("PDF_SPOOL_MIN_BYTES", str(16 * 1024 * 1024)))
+PAGE_WINDOW = int(os.getenv("PDF_PAGE_WINDOW", "16"))
+# resident memory ceiling in MB (0 disables); above it extraction waits, then gives up on the file
+MEMORY_CEILING_MB = int(os.getenv("MEMORY_CEILING_MB", "0"))
+MEMORY_WAIT_SECONDS = float(os.getenv("MEMORY_WAIT_SECONDS", "30"))
+# above this share of the ceiling, table detection is skipped and the LLM reads the text instead
+TABLES_MEMORY_FRACTION = 0.8
+
+class MemoryLimitExceeded(MemoryError):
+    pass
+
+def current_rss_bytes():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _memory_ratio(ceiling_bytes):
+    if not ceiling_bytes:
+        return 0.0
+    rss = current_rss_bytes()
+    return 0.0 if rss is None else rss / ceiling_bytes
+
+def wait_for_memory(ceiling_bytes=None, timeout=None):
+    ceiling_bytes = MEMORY_CEILING_MB * 1024 * 1024 if ceiling_bytes is None else ceiling_bytes
+    timeout = MEMORY_WAIT_SECONDS if timeout is None else timeout
+    if _memory_ratio(ceiling_bytes) < 1.0:
+        return
+    gc.collect()
+    deadline = time.monotonic() + timeout
+    # other documents release their windows as they finish; give them a chance before failing this one
+    while _memory_ratio(ceiling_bytes) >= 1.0:
+        if time.monotonic() >= deadline:
+            raise MemoryLimitExceeded(
+                f"Memory use is above the {ceiling_bytes // (1024 * 1024)} MB ceiling; try fewer or smaller files"
+            )
+        time.sleep(0.2)
+        gc.collect()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: extraction is usually started from worker threads
+            _pool = ProcessPoolExecutor(max_workers=POOL_PROCESSES,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def _open(source):
+    import pdfplumber
+    if isinstance(source, (bytes, bytearray)):
+        return pdfplumber.open(io.BytesIO(source))
+    return pdfplumber.open(source)
+
+@contextmanager
+def _open_mapped(path):
+    # the kernel pages the file in on demand and can drop those pages again under pressure
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        pdf = _open(mapped)
+        try:
+            yield pdf
+        finally:
+            pdf.close()
+
+def _source_size(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    if hasattr(source, "getbuffer"):
+        return source.getbuffer().nbytes
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END)
+    source.seek(position)
+    return size
+
+@contextmanager
+def spooled(source):
+    if isinstance(source, (str, os.PathLike)):
+        yield os.fspath(source)
+        return
+    fd, path = tempfile.mkstemp(prefix="medreport-", suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if isinstance(source, (bytes, bytearray)):
+                f.write(source)
+            else:
+                # copied in blocks, never as one more full in-memory copy of the upload
+                source.seek(0)
+                shutil.copyfileobj(source, f, 1024 * 1024)
+        yield path
+    finally:
+        os.remove(path)
+
+PageContent = namedtuple("PageContent", ["text", "tables"])
+ExtractedDocument = namedtuple("ExtractedDocument", ["pages", "tables"])
+
+def _page_content(page, with_tables=False):
+    text = page.extract_text() or ""
+    tables = page.extract_tables() if with_tables else []
+    # drop the parsed layout/char objects so memory stays flat across pages
+    page.close()
+    return PageContent(text, tables)
+
+def _extract_page_range(source, start, stop, with_tables=False, mapped=False):
+    with (_open_mapped(source) if mapped else _open(source)) as pdf:
+        return [_page_content(pdf.pages[i], with_tables) for i in range(start, min(stop, len(pdf.pages)))]
+
+def _iter_page_windows(path, page_count, use_pool, with_tables):
+    ceiling_bytes = MEMORY_CEILING_MB * 1024 * 1024
+    if use_pool:
+        # workers get the spooled path instead of a pickled copy of the document
+        pool = _get_pool()
+        starts = iter(range(0, page_count, PAGES_PER_TASK))
+        futures = deque()
+        try:
+            while True:
+                # ranges are submitted as earlier ones are consumed, each after the same memory
+                # check as an in-process window, so the ceiling also holds for pooled documents
+                while len(futures) < POOL_PROCESSES * 2:
+                    start = next(starts, None)
+                    if start is None:
+                        break
+                    wait_for_memory(ceiling_bytes)
+                    range_tables = with_tables and _memory_ratio(ceiling_bytes) < TABLES_MEMORY_FRACTION
+                    futures.append(pool.submit(_extract_page_range, path, start, start + PAGES_PER_TASK,
+                                               range_tables, True))
+                if not futures:
+                    break
+                for content in futures.popleft().result():
+                    yield content
+        finally:
+            for future in futures:
+                future.cancel()
+        return
+    for start in range(0, page_count, PAGE_WINDOW):
+        wait_for_memory(ceiling_bytes)
+        window_tables = with_tables and _memory_ratio(ceiling_bytes) < TABLES_MEMORY_FRACTION
+        # reopening per window drops pdfminer's object cache along with the window's pages
+        for content in _extract_page_range(path, start, start + PAGE_WINDOW, window_tables, True):
+            yield content
+
+def _as_pool_source(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    source.seek(0)
+    return source.read()
+
+def _iter_page_contents(source, use_pool=None, with_tables=False):
+    if MEMORY_CEILING_MB or _source_size(source) >= SPOOL_MIN_BYTES:
+        with spooled(source) as path:
+            with _open_mapped(path) as pdf:
+                page_count = len(pdf.pages)
+            if use_pool is None:
+                use_pool = POOL_PROCESSES > 1 and page_count >= POOL_MIN_PAGES
+            yield from _iter_page_windows(path, page_count, use_pool, with_tables)
+        return
+    with _open(source) as pdf:
+        page_count = len(pdf.pages)
+        if use_pool is None:
+            use_pool = POOL_PROCESSES > 1 and page_count >= POOL_MIN_PAGES
+        if not use_pool:
+            for page in pdf.pages:
+                yield _page_content(page, with_tables)
+            return
+    pool_source = _as_pool_source(source)
+    pool = _get_pool()
+    futures = [pool.submit(_extract_page_range, pool_source, start, start + PAGES_PER_TASK, with_tables)
+               for start in range(0, page_count, PAGES_PER_TASK)]
+    try:
+        for future in futures:
+            for content in future.result():
+                yield content
+    finally:
+        for future in futures:
+            future.cancel()
+
+def iter_page_contents(source, use_pool=None, with_tables=False):
+    # only time spent producing pages is counted, not the consumer's work between them
+    return metrics.timed_iter("pdf_extract", _iter_page_contents(source, use_pool, with_tables))
+
+def iter_page_texts(source, use_pool=None):
+    for content in iter_page_contents(source, use_pool):
+        yield content.text
+
+def extract_pages(source, use_pool=None):
+    return [text for text in iter_page_texts(source, use_pool) if text]
+
+def extract_document(source, use_pool=None, with_tables=True):
+    pages = []
+    tables = []
+    for content in iter_page_contents(source, use_pool, with_tables):
+        if content.text:
+            pages.append(content.text)
+        tables.extend(content.tables)
+    return ExtractedDocument(pages, tables)
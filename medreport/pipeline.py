@@ -0,0 +1,63 @@
+import os
+import re
+from collections import namedtuple
+
+from .llm import (MAX_TEXT_LENGTH, TABLE_FAST_PATH, get_scheduler, is_api_error, parse_document,
+                  parse_report_pages, prompt_text)
+from .merge import merge_reports
+from .pdftext import extract_document, iter_page_texts
+
+FileResult = namedtuple("FileResult", ["reports", "messages", "failed"])
+
+def source_name(source):
+    name = getattr(source, "name", None)
+    if name is None and isinstance(source, (str, os.PathLike)):
+        name = os.path.basename(os.fspath(source))
+    return name or "document"
+
+def safe_filename(name, default="document.pdf"):
+    return re.sub(r'[^A-Za-z0-9._-]+', "_", os.path.basename(name or "")) or default
+
+def parse_files(sources, chunked=False, scheduler=None, on_event=None, use_pool=None):
+    scheduler = scheduler or get_scheduler()
+    if chunked:
+        # stream pages straight into the chunk scheduler instead of waiting for the whole PDF
+        return scheduler.map(
+            sources,
+            lambda source: iter_page_texts(source, use_pool),
+            lambda pages: parse_report_pages(pages, True, scheduler)
+        )
+    # well-formed lab tables are parsed directly; the LLM is only called when confidence is low
+    return scheduler.map(
+        sources,
+        lambda source: extract_document(source, use_pool, with_tables=TABLE_FAST_PATH),
+        lambda document: parse_document(document, False, scheduler, on_event=on_event)
+    )
+
+def file_result(result, chunked=False):
+    messages = []
+    table_parsed = any((report.get("extraction") or {}).get("method") == "table" for report in result.value or [])
+    if not chunked and result.text is not None and not table_parsed:
+        text_length = len(prompt_text(result.text.pages))
+        if text_length > MAX_TEXT_LENGTH:
+            messages.append(("warning", f"The PDF text was truncated from {text_length} to {MAX_TEXT_LENGTH} characters to avoid token limit errors."))
+    if any((report.get("extraction") or {}).get("complete") is False for report in result.value or []):
+        messages.append(("warning", f"The model's response for {source_name(result.item)} was cut off; only the entries received before that are shown."))
+    duplicate = next((report["extraction"] for report in result.value or []
+                      if (report.get("extraction") or {}).get("method") == "duplicate"), None)
+    if duplicate is not None:
+        messages.append(("info", f"{source_name(result.item)} is a near-duplicate of {duplicate['source'] or 'an earlier document'} (similarity {duplicate['similarity']:.2f}); its extraction was reused instead of calling the LLM."))
+    if result.error is not None and is_api_error(result.error):
+        messages.append(("error", f"API Error: {str(result.error)}"))
+    elif result.error is not None:
+        messages.append(("error", f"Error processing file: {str(result.error)}"))
+    return FileResult(result.value if result.error is None else [], messages, result.error is not None)
+
+def final_reports(all_reports, file_count):
+    # a single upload is shown as parsed; several are merged per patient
+    return merge_reports(all_reports) if file_count > 1 else all_reports
+
+def run_batch(sources, chunked=False, scheduler=None):
+    results = [file_result(result, chunked) for result in parse_files(sources, chunked, scheduler)]
+    all_reports = [report for result in results for report in result.reports]
+    return results, final_reports(all_reports, len(results))
@@ -0,0 +1,451 @@
+import importlib.util
+import multiprocessing
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, Image as PlatypusImage
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from io import BytesIO
+
+from .charts import blood_chart_drawing
+from .classify import get_report_type
+from .columns import STATUS_ABOVE, STATUS_BELOW, TestResultColumns
+from .metrics import stage
+from .rules import urine_rules
+
+# "matplotlib" rasterizes charts to PNG, "vector" draws them as native ReportLab graphics
+DEFAULT_CHART_BACKEND = os.getenv("CHART_BACKEND", "matplotlib")
+PER_REPORT_RENDER_MIN_REPORTS = int(os.getenv("PDF_PER_REPORT_MIN_REPORTS", "20"))
+RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", str(os.cpu_count() or 1)))
+
+URINE_STATUS_COLORS = {"Normal": colors.lightgreen}
+BLOOD_STATUS_COLORS = {"Normal": colors.lightgreen, "Below Normal": colors.lightyellow}
+URINE_COLOR_HEX = {
+    "pale yellow": "#FFFFA0",
+    "yellow": "#FFFF00",
+    "dark yellow": "#CCCC00",
+    "amber": "#FFBF00",
+    "orange": "#FFA500",
+    "red": "#FF0000",
+    "pink": "#FFC0CB",
+    "brown": "#A52A2A",
+    "clear": "#F0F8FF",
+    "cloudy": "#E6E6FA"
+}
+
+def _has_pypdf():
+    return importlib.util.find_spec("pypdf") is not None
+
+@lru_cache(maxsize=None)
+def get_styles():
+    return getSampleStyleSheet()
+
+@lru_cache(maxsize=None)
+def table_style(header_color, padding=6):
+    return TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor(header_color)),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, 0), 11),
+        ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+        ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
+        ("FONTSIZE", (0, 1), (-1, -1), 10),
+        ("ALIGN", (0, 1), (-1, -1), "CENTER"),
+        ("BACKGROUND", (0, 1), (-1, -1), colors.whitesmoke),
+        ("GRID", (0, 0), (-1, -1), 0.8, colors.black),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), padding),
+        ("TOPPADDING", (0, 0), (-1, -1), padding),
+    ])
+
+def status_style(statuses, status_colors, column=3, default=colors.lightcoral):
+    return TableStyle([
+        ("BACKGROUND", (column, row), (column, row), status_colors.get(status, default))
+        for row, status in enumerate(statuses, start=1)
+    ])
+
+def add_urine_test_visualization(report, elements, columns=None):
+    styles = get_styles()
+    test_results = report.get("test_results", [])
+    if not test_results:
+        elements.append(Paragraph("<b>Note:</b> No urine test data found for visualization.", styles['Normal']))
+        elements.append(Spacer(1, 10))
+        return
+    elements.append(Paragraph("<b>Urine Test Results:</b>", styles['Heading3']))
+    elements.append(Spacer(1, 8))
+    header = ["Parameter", "Result", "Reference Range", "Status"]
+    rows = [header]
+    if columns is None:
+        columns = TestResultColumns.from_reports([report])
+    entries = []
+    for row, test in enumerate(report.get("test_results", [])):
+        test_name = (test.get("test_name") or "").strip().lower()
+        value_raw = test.get("value") or ""
+        value = str(value_raw).strip().lower() if not isinstance(value_raw, float) else str(value_raw).lower()
+        ref_range = str(test.get("reference_range") or "").strip()
+        if test_name and value:
+            entries.append((row, test_name, value, ref_range))
+    statuses = urine_rules.evaluate_many([entry[1] for entry in entries], [entry[2] for entry in entries])
+    for (row, test_name, value, ref_range), status in zip(entries, statuses):
+        if status is None:
+            status = "Abnormal" if columns.status[row] in (STATUS_BELOW, STATUS_ABOVE) else "Normal"
+        rows.append([test_name.title(), value, ref_range, status])
+    if len(rows) > 1:
+        table = Table(rows, colWidths=[120, 100, 120, 80], hAlign="CENTER")
+        table.setStyle(table_style("#3498db"))
+        table.setStyle(status_style([row[3] for row in rows[1:]], URINE_STATUS_COLORS))
+        elements.append(table)
+        elements.append(Spacer(1, 20))
+        for test in test_results:
+            if "color" in (test.get("test_name") or "").lower():
+                color_value = (test.get("value") or "").lower()
+                if color_value:
+                    elements.append(Paragraph("<b>Urine Color Representation:</b>", styles['Heading3']))
+                    elements.append(Spacer(1, 8))
+                    color_code = "#FFFFA0"
+                    for color_name, hex_code in URINE_COLOR_HEX.items():
+                        if color_name in color_value:
+                            color_code = hex_code
+                            break
+                    color_table = Table([[""], [""], [""]], colWidths=[100], rowHeights=[50, 50, 50])
+                    color_table.setStyle(TableStyle([
+                        ("BACKGROUND", (0, 0), (0, 2), colors.HexColor(color_code)),
+                        ("BOX", (0, 0), (0, 2), 1, colors.black),
+                    ]))
+                    elements.append(color_table)
+                    elements.append(Spacer(1, 10))
+                    elements.append(Paragraph(f"<i>Reported color: {color_value}</i>", styles['Normal']))
+                    elements.append(Spacer(1, 20))
+                    break
+
+def add_imaging_report_visualization(report, elements):
+    styles = get_styles()
+    findings = None
+    impression = None
+    for test in report.get("test_results", []):
+        test_name = (test.get("test_name") or "").lower()
+        if "finding" in test_name:
+            findings = test.get("value")
+        elif "impression" in test_name:
+            impression = test.get("value")
+    if not findings and not impression and "doctor_notes" in report:
+        notes = report.get("doctor_notes", "")
+        if "finding" in notes.lower():
+            findings_section = re.search(r'(?i)findings?:(.+?)(?:impression:|assessment:|conclusion:|$)', notes, re.DOTALL)
+            if findings_section:
+                findings = findings_section.group(1).strip()
+        if "impression" in notes.lower():
+            impression_section = re.search(r'(?i)impression:(.+?)(?:recommendation:|plan:|$)', notes, re.DOTALL)
+            if impression_section:
+                impression = impression_section.group(1).strip()
+    if findings:
+        elements.append(Paragraph("<b>Findings:</b>", styles['Heading3']))
+        elements.append(Spacer(1, 8))
+        elements.append(Paragraph(findings, styles['Normal']))
+        elements.append(Spacer(1, 15))
+    if impression:
+        elements.append(Paragraph("<b>Impression:</b>", styles['Heading3']))
+        elements.append(Spacer(1, 8))
+        elements.append(Paragraph(impression, styles['Normal']))
+        elements.append(Spacer(1, 15))
+    if not findings and not impression:
+        elements.append(Paragraph("<b>Note:</b> No structured findings or impressions found in this imaging report.", 
+                                styles['Normal']))
+        elements.append(Spacer(1, 10))
+
+def add_pathology_report_visualization(report, elements):
+    styles = get_styles()
+    specimen = None
+    diagnosis = None
+    microscopic = None
+    for test in report.get("test_results", []):
+        test_name = (test.get("test_name") or "").lower()
+        if "specimen" in test_name:
+            specimen = test.get("value")
+        elif "diagnosis" in test_name:
+            diagnosis = test.get("value")
+        elif "microscopic" in test_name:
+            microscopic = test.get("value")
+    if not any([specimen, diagnosis, microscopic]) and "doctor_notes" in report:
+        notes = report.get("doctor_notes", "")
+        if "specimen" in notes.lower():
+            specimen_section = re.search(r'(?i)specimen:(.+?)(?:clinical|gross|microscopic|diagnosis:|$)', notes, re.DOTALL)
+            if specimen_section:
+                specimen = specimen_section.group(1).strip()
+        if "diagnosis" in notes.lower():
+            diagnosis_section = re.search(r'(?i)diagnosis:(.+?)(?:comment:|note:|$)', notes, re.DOTALL)
+            if diagnosis_section:
+                diagnosis = diagnosis_section.group(1).strip()
+        if "microscopic" in notes.lower():
+            microscopic_section = re.search(r'(?i)microscopic:(.+?)(?:diagnosis:|assessment:|$)', notes, re.DOTALL)
+            if microscopic_section:
+                microscopic = microscopic_section.group(1).strip()
+    if specimen:
+        elements.append(Paragraph("<b>Specimen:</b>", styles['Heading3']))
+        elements.append(Spacer(1, 8))
+        elements.append(Paragraph(specimen, styles['Normal']))
+        elements.append(Spacer(1, 15))
+    if diagnosis:
+        elements.append(Paragraph("<b>Diagnosis:</b>", styles['Heading3']))
+        elements.append(Spacer(1, 8))
+        elements.append(Paragraph(diagnosis, styles['Normal']))
+        elements.append(Spacer(1, 15))
+    if microscopic:
+        elements.append(Paragraph("<b>Microscopic Description:</b>", styles['Heading3']))
+        elements.append(Spacer(1, 8))
+        elements.append(Paragraph(microscopic, styles['Normal']))
+        elements.append(Spacer(1, 15))
+    if not any([specimen, diagnosis, microscopic]):
+        elements.append(Paragraph("<b>Note:</b> No structured pathology data found in this report.", 
+                                styles['Normal']))
+        elements.append(Spacer(1, 10))
+
+def add_generic_report_visualization(report, elements):
+    styles = get_styles()
+    elements.append(Paragraph("<b>Note:</b> This is a general medical report without specific visualization.", 
+                            styles['Normal']))
+    elements.append(Spacer(1, 15))
+    test_names = []
+    values = []
+    units = []
+    ref_ranges = []
+    for test in report.get("test_results", []):
+        test_name = (test.get("test_name") or "").strip()
+        value_raw = test.get("value") or ""
+        value_str = str(value_raw).strip() if not isinstance(value_raw, float) else str(value_raw)
+        unit = str(test.get("unit") or "").strip()
+        ref_range = str(test.get("reference_range") or "").strip()
+        if test_name and value_str:
+            test_names.append(test_name)
+            values.append(value_str)
+            units.append(unit)
+            ref_ranges.append(ref_range)
+    if test_names:
+        elements.append(Paragraph("<b>Test Results Summary:</b>", styles['Heading3']))
+        elements.append(Spacer(1, 8))
+        header = ["Test", "Result", "Unit", "Reference Range"]
+        rows = [header]
+        for i in range(len(test_names)):
+            rows.append([test_names[i], values[i], units[i], ref_ranges[i]])
+        table = Table(rows, colWidths=[120, 100, 80, 120], hAlign="CENTER")
+        table.setStyle(table_style("#9b59b6"))
+        elements.append(table)
+        elements.append(Spacer(1, 20))
+
+def _matplotlib_blood_chart(chart_test_names, chart_actual_values, chart_normal_mins, chart_normal_maxs, chart_title):
+    import matplotlib.pyplot as plt
+    import numpy as np
+    fig, ax = plt.subplots(figsize=(12, 6))
+    x = np.arange(len(chart_test_names))
+    width = 0.35
+    normal_midpoints = [(min_val + max_val) / 2 for min_val, max_val in zip(chart_normal_mins, chart_normal_maxs)]
+    bars1 = ax.bar(x - width/2, chart_actual_values, width, label='Your Values', 
+                   color='#2ecc71', alpha=0.8, edgecolor='black', linewidth=1)
+    bars2 = ax.bar(x + width/2, normal_midpoints, width, label='Normal Range (Average)', 
+                   color='#3498db', alpha=0.8, edgecolor='black', linewidth=1)
+    range_errors = [[(mid - min_val), (max_val - mid)] for mid, min_val, max_val in 
+                   zip(normal_midpoints, chart_normal_mins, chart_normal_maxs)]
+    range_errors = np.array(range_errors).T
+    ax.errorbar(x + width/2, normal_midpoints, yerr=range_errors, 
+                fmt='none', color='black', capsize=5, alpha=0.7)
+    ax.set_xlabel('Blood Tests', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Values', fontsize=12, fontweight='bold')
+    ax.set_title(chart_title, fontsize=14, fontweight='bold', pad=20)
+    ax.set_xticks(x)
+    ax.set_xticklabels(chart_test_names, rotation=45, ha='right', fontsize=10)
+    ax.legend(fontsize=11)
+    ax.grid(True, alpha=0.3, axis='y')
+    for i, (bar1, bar2, actual, normal_mid, min_val, max_val) in enumerate(zip(
+            bars1, bars2, chart_actual_values, normal_midpoints, chart_normal_mins, chart_normal_maxs)):
+        ax.text(bar1.get_x() + bar1.get_width()/2., actual + max(chart_actual_values) * 0.01,
+                f'{actual:.1f}', ha='center', va='bottom', fontsize=9, fontweight='bold')
+        ax.text(bar2.get_x() + bar2.get_width()/2., normal_mid + max(normal_midpoints) * 0.01,
+                f'{min_val:.1f}-{max_val:.1f}', ha='center', va='bottom', 
+                fontsize=8, rotation=0)
+        if actual < min_val or actual > max_val:
+            bars1[i].set_color('#e74c3c')
+        else:
+            bars1[i].set_color('#2ecc71')
+    plt.tight_layout()
+    img_buffer = BytesIO()
+    plt.savefig(img_buffer, format="png", dpi=150, bbox_inches='tight')
+    plt.close()
+    img_buffer.seek(0)
+    return PlatypusImage(img_buffer, width=550, height=330)
+
+def add_blood_test_bargraph(report, elements, chart_backend=None, columns=None):
+    chart_backend = chart_backend or DEFAULT_CHART_BACKEND
+    if columns is None:
+        columns = TestResultColumns.from_reports([report])
+    charted = columns.has_range
+    test_names = columns.names[charted].tolist()
+    actual_values = columns.values[charted].tolist()
+    normal_mins = columns.range_min[charted].tolist()
+    normal_maxs = columns.range_max[charted].tolist()
+    original_values = columns.raw_values[charted].tolist()
+    original_ranges = columns.raw_ranges[charted].tolist()
+    statuses = columns.status_labels()[charted].tolist()
+    if not test_names:
+        elements.append(Paragraph("<b>Note:</b> No valid numerical data found for blood test chart generation.", 
+                                get_styles()['Normal']))
+        elements.append(Spacer(1, 10))
+        return
+    max_tests_per_chart = 4
+    num_charts = (len(test_names) + max_tests_per_chart - 1) // max_tests_per_chart
+    for chart_index in range(num_charts):
+        start_idx = chart_index * max_tests_per_chart
+        end_idx = min(start_idx + max_tests_per_chart, len(test_names))
+        chart_test_names = test_names[start_idx:end_idx]
+        chart_actual_values = actual_values[start_idx:end_idx]
+        chart_normal_mins = normal_mins[start_idx:end_idx]
+        chart_normal_maxs = normal_maxs[start_idx:end_idx]
+        chart_title = 'Your Blood Test Results vs Normal Range'
+        if num_charts > 1:
+            chart_title += f' (Chart {chart_index + 1} of {num_charts})'
+        with stage("chart"):
+            if chart_backend == "vector":
+                chart = blood_chart_drawing(chart_test_names, chart_actual_values, chart_normal_mins,
+                                            chart_normal_maxs, chart_title)
+            else:
+                chart = _matplotlib_blood_chart(chart_test_names, chart_actual_values, chart_normal_mins,
+                                                chart_normal_maxs, chart_title)
+        elements.append(Spacer(1, 15))
+        chart_heading = "<b>Blood Test Comparison Chart</b>"
+        if num_charts > 1:
+            chart_heading += f" <i>(Chart {chart_index + 1} of {num_charts})</i>"
+        elements.append(Paragraph(chart_heading, get_styles()['Heading3']))
+        elements.append(Spacer(1, 8))
+        elements.append(chart)
+        elements.append(Spacer(1, 20))
+    elements.append(Paragraph("<b>Values Comparison Table:</b>", get_styles()['Heading3']))
+    elements.append(Spacer(1, 8))
+    comparison_header = ["Test Name", "Your Value", "Normal Range", "Status"]
+    comparison_rows = [comparison_header]
+    for test_name, original_val, original_range, status in zip(test_names, original_values, original_ranges, statuses):
+        comparison_rows.append([test_name, original_val, original_range, status])
+    comparison_table = Table(comparison_rows, colWidths=[120, 80, 100, 80], hAlign="CENTER")
+    comparison_table.setStyle(table_style("#34495e", padding=8))
+    comparison_table.setStyle(status_style([row[3] for row in comparison_rows[1:]], BLOOD_STATUS_COLORS))
+    elements.append(comparison_table)
+    elements.append(Spacer(1, 20))
+
+def _new_document(output_file):
+    return SimpleDocTemplate(
+        output_file,
+        pagesize=A4,
+        leftMargin=40,
+        rightMargin=40,
+        topMargin=60,
+        bottomMargin=60
+    )
+
+def render_report(report, chart_backend=None, columns=None):
+    styles = get_styles()
+    if columns is None:
+        columns = TestResultColumns.from_reports([report])
+    elements = []
+    elements.append(Paragraph("<b>Medical Report</b>", styles['Title']))
+    elements.append(Spacer(1, 18))
+    if "patient_info" in report:
+        patient_info = report["patient_info"]
+        pat_text = "<br/>".join([
+            f"<b>Name:</b> {patient_info.get('name', 'N/A')}",
+            f"<b>Age:</b> {patient_info.get('age', 'N/A')}",
+            f"<b>Sex:</b> {patient_info.get('sex', 'N/A')}"
+        ])
+        elements.append(Paragraph(pat_text, styles['Normal']))
+        elements.append(Spacer(1, 18))
+    elements.append(Paragraph(
+        f"<b>Report Type:</b> {report.get('report_type','Unknown')}",
+        styles['Heading2']
+    ))
+    elements.append(Spacer(1, 18))
+    if "test_results" in report and report["test_results"]:
+        header = ["Test Name", "Value", "Unit", "Reference Range"]
+        all_rows = [header]
+        for test in report["test_results"]:
+            test_name = (test.get("test_name") or "").strip()
+            value_raw = test.get("value") or ""
+            value = str(value_raw).strip() if not isinstance(value_raw, float) else str(value_raw)
+            unit = str(test.get("unit") or "").strip()
+            ref_range = str(test.get("reference_range") or "").strip()
+            if not test_name or (not value and not unit and not ref_range):
+                continue
+            all_rows.append([test_name, value, unit, ref_range])
+        if len(all_rows) > 1:
+            max_rows = 6
+            chunks = [all_rows[i:i + max_rows] for i in range(0, len(all_rows), 5)]
+            for idx, chunk in enumerate(chunks):
+                table = Table(chunk, colWidths=[120, 100, 80, 120], hAlign="CENTER")
+                table.setStyle(table_style("#4CAF50" if idx % 2 == 0 else "#2196F3"))
+                elements.append(table)
+                elements.append(Spacer(1, 20))
+    report_type = get_report_type(report)
+    if report_type == "blood":
+        add_blood_test_bargraph(report, elements, chart_backend, columns)
+    elif report_type == "urine":
+        add_urine_test_visualization(report, elements, columns)
+    elif report_type == "imaging":
+        add_imaging_report_visualization(report, elements)
+    elif report_type == "pathology":
+        add_pathology_report_visualization(report, elements)
+    else:
+        add_generic_report_visualization(report, elements)
+    if "doctor_notes" in report:
+        elements.append(Paragraph("<b>Doctor Notes:</b>", styles['Heading3']))
+        elements.append(Spacer(1, 8))
+        elements.append(Paragraph(report["doctor_notes"], styles['Normal']))
+        elements.append(Spacer(1, 25))
+    return elements
+
+def render_report_pdf(report, output_file, chart_backend=None):
+    elements = render_report(report, chart_backend)
+    with stage("pdf_build"):
+        _new_document(output_file).build(elements)
+    return output_file
+
+def _render_report_file(args):
+    report, path, chart_backend = args
+    return render_report_pdf(report, path, chart_backend)
+
+def _concatenate_pdfs(paths, output_file):
+    from pypdf import PdfWriter
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(path)
+    writer.write(output_file)
+    writer.close()
+
+def _generate_pdf_per_report(parsed_reports, output_file, chart_backend, workers):
+    with tempfile.TemporaryDirectory(prefix="medreport-") as tmp_dir:
+        jobs = [(report, os.path.join(tmp_dir, f"report_{i:06d}.pdf"), chart_backend)
+                for i, report in enumerate(parsed_reports)]
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=multiprocessing.get_context("spawn")) as pool:
+                paths = list(pool.map(_render_report_file, jobs, chunksize=4))
+        else:
+            paths = [_render_report_file(job) for job in jobs]
+        with stage("pdf_concatenate"):
+            _concatenate_pdfs(paths, output_file)
+    return output_file
+
+def generate_pdf(parsed_reports, output_file, chart_backend=None, workers=None):
+    workers = RENDER_WORKERS if workers is None else max(1, workers)
+    if len(parsed_reports) >= PER_REPORT_RENDER_MIN_REPORTS and _has_pypdf():
+        # render every report as its own document and stitch the PDFs together, so only
+        # one report's flowables are alive per process however large the batch is
+        return _generate_pdf_per_report(parsed_reports, output_file, chart_backend, workers)
+    # values and reference ranges are parsed once for the whole batch
+    columns = TestResultColumns.from_reports(parsed_reports)
+    elements = []
+    for i, report in enumerate(parsed_reports):
+        elements.extend(render_report(report, chart_backend, columns.for_report(i)))
+        if i < len(parsed_reports) - 1:
+            elements.append(PageBreak())
+    with stage("pdf_build"):
+        _new_document(output_file).build(elements)
+    return output_file
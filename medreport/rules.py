@@ -0,0 +1,123 @@
+import re
+from functools import lru_cache
+
+from .parsing import parse_value_with_units
+
+NORMAL = "Normal"
+ABNORMAL = "Abnormal"
+
+NEGATIVE = ["negative", "none", "0", "normal"]
+POSITIVE = ["positive", "trace", "1+", "2+", "3+", "4+"]
+
+# parameter -> {"normal": tokens or (low, high), "abnormal": tokens}; the first parameter
+# contained in a test name decides, so the order matters
+URINE_RULES = {
+    "color": {
+        "normal": ["pale yellow", "yellow", "straw", "amber", "clear"],
+        "abnormal": ["red", "brown", "orange", "green", "blue", "cloudy", "turbid"]
+    },
+    "clarity": {
+        "normal": ["clear", "transparent"],
+        "abnormal": ["cloudy", "turbid", "hazy"]
+    },
+    "ph": {"normal": (4.5, 8.0)},
+    "specific gravity": {"normal": (1.005, 1.030)},
+    "glucose": {"normal": NEGATIVE, "abnormal": POSITIVE},
+    "protein": {"normal": NEGATIVE, "abnormal": POSITIVE},
+    "ketones": {"normal": NEGATIVE, "abnormal": POSITIVE},
+    "blood": {"normal": NEGATIVE, "abnormal": POSITIVE},
+    "nitrite": {"normal": NEGATIVE, "abnormal": ["positive"]},
+    "leukocytes": {"normal": NEGATIVE, "abnormal": POSITIVE},
+    "bacteria": {
+        "normal": NEGATIVE + ["not seen"],
+        "abnormal": ["positive", "present", "few", "moderate", "many"]
+    },
+    "epithelial cells": {
+        "normal": NEGATIVE + ["few", "occasional"],
+        "abnormal": ["moderate", "many"]
+    },
+}
+
+# name-independent rules for qualitative results such as serology or dipstick screens; values
+# that contain none of the tokens are left ungraded
+QUALITATIVE_RULES = {
+    "": {
+        "normal": ["negative", "non-reactive", "non reactive", "nonreactive", "not detected", "absent", "nil"],
+        "abnormal": ["positive", "reactive", "detected", "present", "trace", "1+", "2+", "3+", "4+"]
+    },
+}
+# "O positive", "AB-" and the like are blood groups, not test findings
+BLOOD_GROUP = re.compile(r"(?:a|b|ab|o)\s*(?:rh\s*)?(?:positive|negative|pos|neg|\+|-)(?:ve)?")
+
+def _token_pattern(tokens):
+    if not tokens:
+        return None
+    # longest first so the alternation never stops at a shorter token that is a prefix
+    return re.compile("|".join(re.escape(t) for t in sorted(set(tokens), key=len, reverse=True)))
+
+class _CompiledRule:
+    __slots__ = ("normal", "abnormal", "normal_range", "unmatched")
+
+    def __init__(self, spec, unmatched=ABNORMAL):
+        self.unmatched = unmatched
+        normal = spec.get("normal")
+        self.normal_range = tuple(normal) if isinstance(normal, tuple) else None
+        self.normal = None if self.normal_range else _token_pattern(normal)
+        self.abnormal = None if self.normal_range else _token_pattern(spec.get("abnormal"))
+
+    def evaluate(self, value):
+        if self.normal_range is not None:
+            number = parse_value_with_units(value)
+            low, high = self.normal_range
+            return NORMAL if number is not None and low <= number <= high else ABNORMAL
+        normal_spans = [] if self.normal is None else [found.span() for found in self.normal.finditer(value)]
+        if not normal_spans:
+            if self.abnormal is not None and self.abnormal.search(value):
+                return ABNORMAL
+            return self.unmatched
+        if self.abnormal is not None:
+            # an abnormal token that is only part of a normal one ("reactive" in "non-reactive",
+            # "detected" in "not detected") does not count against it
+            for found in self.abnormal.finditer(value):
+                if not any(start <= found.start() and found.end() <= end for start, end in normal_spans):
+                    return ABNORMAL
+        return NORMAL
+
+class RuleSet:
+    def __init__(self, rules, memo_size=65536, unmatched=ABNORMAL):
+        # unmatched is the status of a value that contains neither a normal nor an abnormal token
+        self.parameters = list(rules)
+        self._rules = [_CompiledRule(rules[parameter], unmatched) for parameter in self.parameters]
+        # one anchored pass: alternatives are tried in rule order and each lookahead scans the
+        # whole name, so the first listed parameter contained in the name wins
+        self._matcher = re.compile("^(?:" + "|".join(
+            f"(?=.*?{re.escape(parameter)})(?P<r{i}>)" for i, parameter in enumerate(self.parameters)
+        ) + ")", re.DOTALL) if self.parameters else None
+        self.match = lru_cache(maxsize=memo_size)(self._match)
+        self.evaluate = lru_cache(maxsize=memo_size)(self._evaluate)
+
+    def _match(self, test_name):
+        if self._matcher is None:
+            return None
+        found = self._matcher.match(test_name)
+        return int(found.lastgroup[1:]) if found else None
+
+    def _evaluate(self, test_name, value):
+        index = self.match(test_name)
+        if index is None:
+            return None
+        return self._rules[index].evaluate(value)
+
+    def evaluate_many(self, test_names, values):
+        # names and values are expected lower-cased and stripped; None means no rule applies
+        evaluate = self.evaluate
+        return [evaluate(name, value) for name, value in zip(test_names, values)]
+
+urine_rules = RuleSet(URINE_RULES)
+qualitative_rules = RuleSet(QUALITATIVE_RULES, unmatched=None)
+
+def qualitative_status(value):
+    value = str(value or "").strip().lower()
+    if BLOOD_GROUP.fullmatch(value):
+        return None
+    return qualitative_rules.evaluate("", value)
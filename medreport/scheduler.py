@@ -0,0 +1,146 @@
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .metrics import stage, with_current_file
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+DEFAULT_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "30000"))
+
+TaskResult = namedtuple("TaskResult", ["item", "text", "value", "error"])
+
+def estimate_tokens(text, completion_tokens=1024):
+    # ~4 characters per token for English text, plus room for the JSON answer
+    return len(text or "") // 4 + completion_tokens
+
+def is_rate_limit_error(exc):
+    return getattr(exc, "status_code", None) == 429
+
+def retry_after_seconds(exc):
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+class RateLimiter:
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, clock=time.monotonic, sleep=time.sleep):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        now = clock()
+        self._updated = now
+        self._paused_until = now
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(float(self.requests_per_minute),
+                                 self._requests + elapsed * self.requests_per_minute / 60.0)
+        if self.tokens_per_minute:
+            self._tokens = min(float(self.tokens_per_minute),
+                               self._tokens + elapsed * self.tokens_per_minute / 60.0)
+
+    def acquire(self, tokens=0):
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self.requests_per_minute and self._requests < 1:
+                        wait = (1 - self._requests) * 60.0 / self.requests_per_minute
+                    if self.tokens_per_minute and self._tokens < tokens:
+                        wait = max(wait, (tokens - self._tokens) * 60.0 / self.tokens_per_minute)
+                if wait <= 0:
+                    if self.requests_per_minute:
+                        self._requests -= 1
+                    if self.tokens_per_minute:
+                        self._tokens -= tokens
+                    return
+            self._sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+class ExtractionScheduler:
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, rate_limiter=None, extract_workers=None,
+                 max_retries=5, base_delay=1.0, max_delay=60.0, token_estimator=estimate_tokens):
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.extract_workers = extract_workers or min(8, os.cpu_count() or 1)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.token_estimator = token_estimator
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+
+    def _backoff(self, attempt, exc):
+        delay = retry_after_seconds(exc)
+        if delay is None:
+            delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+            delay = delay / 2 + random.uniform(0, delay / 2)
+        return delay
+
+    def call_llm(self, fn, text):
+        attempt = 0
+        while True:
+            with stage("rate_limit_wait"):
+                self.rate_limiter.acquire(self.token_estimator(text))
+            with self._slots:
+                try:
+                    return fn(text)
+                except Exception as exc:
+                    if not is_rate_limit_error(exc) or attempt >= self.max_retries:
+                        raise
+                    delay = self._backoff(attempt, exc)
+            self.rate_limiter.pause(delay)
+            attempt += 1
+
+    def map(self, items, extract_fn, process_fn):
+        items = list(items)
+        texts = [None] * len(items)
+        results = [None] * len(items)
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=self.extract_workers) as extract_pool, \
+             ThreadPoolExecutor(max_workers=max(self.max_concurrency, min(len(items), 32))) as process_pool:
+            labels = [getattr(item, "name", None)
+                      or (os.path.basename(os.fspath(item)) if isinstance(item, (str, os.PathLike)) else None)
+                      or f"item-{i}" for i, item in enumerate(items)]
+            extract_futures = {extract_pool.submit(with_current_file, labels[i], extract_fn, item): i
+                               for i, item in enumerate(items)}
+            process_futures = {}
+            # hand each document to the LLM stage as soon as its text is ready
+            for future in as_completed(extract_futures):
+                i = extract_futures[future]
+                try:
+                    texts[i] = future.result()
+                except Exception as exc:
+                    results[i] = TaskResult(items[i], None, None, exc)
+                    continue
+                process_futures[process_pool.submit(with_current_file, labels[i], process_fn, texts[i])] = i
+            for future in as_completed(process_futures):
+                i = process_futures[future]
+                try:
+                    results[i] = TaskResult(items[i], texts[i], future.result(), None)
+                except Exception as exc:
+                    results[i] = TaskResult(items[i], texts[i], None, exc)
+        return results
@@ -0,0 +1,134 @@
+import argparse
+import asyncio
+import base64
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+from .metrics import metrics, stage
+
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8000"))
+# batches processed at once; further requests wait up to SERVICE_QUEUE_TIMEOUT seconds for a slot
+SERVICE_MAX_CONCURRENT_REQUESTS = int(os.getenv("SERVICE_MAX_CONCURRENT_REQUESTS", "4"))
+SERVICE_QUEUE_TIMEOUT = float(os.getenv("SERVICE_QUEUE_TIMEOUT", "30"))
+SERVICE_MAX_FILES = int(os.getenv("SERVICE_MAX_FILES", "100"))
+SERVICE_MAX_UPLOAD_MB = int(os.getenv("SERVICE_MAX_UPLOAD_MB", "256"))
+SERVICE_KEEPALIVE_SECONDS = int(os.getenv("SERVICE_KEEPALIVE_SECONDS", "75"))
+
+def _flag(value):
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+def process_batch(paths, chunked=False, include_pdf=False, scheduler=None):
+    from .classify import get_report_type
+    from .pipeline import run_batch, source_name
+    from .render import generate_pdf
+    from .store import RESULTS_STORE_ENABLED, get_results_store
+    results, reports = run_batch(paths, chunked, scheduler)
+    all_reports = [report for result in results for report in result.reports]
+    if RESULTS_STORE_ENABLED and all_reports:
+        with stage("store"):
+            get_results_store().save_reports(all_reports, source=", ".join(source_name(path) for path in paths))
+    body = {
+        "files": [{
+            "name": source_name(path),
+            "failed": result.failed,
+            "messages": [{"level": level, "message": message} for level, message in result.messages],
+            "reports": result.reports,
+        } for path, result in zip(paths, results)],
+        "reports": reports,
+        "report_categories": [get_report_type(report) for report in reports],
+    }
+    if include_pdf:
+        pdf_buffer = BytesIO()
+        generate_pdf(reports, pdf_buffer)
+        body["pdf"] = base64.b64encode(pdf_buffer.getvalue()).decode("ascii")
+    return body
+
+def create_app(max_concurrent_requests=SERVICE_MAX_CONCURRENT_REQUESTS, queue_timeout=SERVICE_QUEUE_TIMEOUT,
+               max_files=SERVICE_MAX_FILES, max_upload_mb=SERVICE_MAX_UPLOAD_MB, scheduler=None):
+    from starlette.applications import Starlette
+    from starlette.concurrency import run_in_threadpool
+    from starlette.datastructures import UploadFile
+    from starlette.responses import JSONResponse, PlainTextResponse
+    from starlette.routing import Route
+
+    slots = asyncio.Semaphore(max(1, max_concurrent_requests))
+
+    def error(status_code, message, headers=None):
+        return JSONResponse({"error": message}, status_code=status_code, headers=headers)
+
+    async def parse_reports(request):
+        content_length = request.headers.get("content-length")
+        if content_length:
+            try:
+                content_length = int(content_length)
+            except ValueError:
+                return error(400, "Malformed Content-Length header")
+            if content_length < 0:
+                return error(400, "Malformed Content-Length header")
+            if content_length > max_upload_mb * 1024 * 1024:
+                return error(413, f"Request body is larger than {max_upload_mb} MB")
+        chunked = _flag(request.query_params.get("chunked", "0"))
+        include_pdf = _flag(request.query_params.get("include_pdf", "0"))
+        try:
+            await asyncio.wait_for(slots.acquire(), queue_timeout)
+        except asyncio.TimeoutError:
+            metrics.increment("service_rejected_requests")
+            return error(503, "Too many batches in progress", {"Retry-After": str(int(queue_timeout))})
+        try:
+            async with request.form(max_files=max_files, max_part_size=max_upload_mb * 1024 * 1024) as form:
+                uploads = [upload for upload in form.getlist("files") if isinstance(upload, UploadFile)]
+                if not uploads:
+                    return error(400, "Send the PDFs as multipart form fields named 'files'")
+                # uploads are written to disk under their own names, so large batches are not held
+                # in memory and the pipeline reports errors against the original file names
+                with tempfile.TemporaryDirectory(prefix="medreport-batch-") as batch_dir:
+                    paths = await run_in_threadpool(_save_uploads, uploads, batch_dir)
+                    body = await run_in_threadpool(process_batch, paths, chunked, include_pdf, scheduler)
+        finally:
+            slots.release()
+        metrics.increment("service_batches")
+        metrics.increment("service_files", len(uploads))
+        return JSONResponse(body)
+
+    async def health(request):
+        return JSONResponse({"status": "ok"})
+
+    async def metrics_text(request):
+        return PlainTextResponse(metrics.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+    return Starlette(routes=[
+        Route("/v1/reports", parse_reports, methods=["POST"]),
+        Route("/healthz", health, methods=["GET"]),
+        Route("/metrics", metrics_text, methods=["GET"]),
+    ])
+
+def _save_uploads(uploads, batch_dir):
+    from .pipeline import safe_filename
+    paths = []
+    for position, upload in enumerate(uploads):
+        file_dir = os.path.join(batch_dir, str(position))
+        os.makedirs(file_dir)
+        path = os.path.join(file_dir, safe_filename(upload.filename))
+        upload.file.seek(0)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(upload.file, f, 1024 * 1024)
+        paths.append(path)
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the report parsing pipeline over HTTP.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--max-concurrent-requests", type=int, default=SERVICE_MAX_CONCURRENT_REQUESTS)
+    parser.add_argument("--keepalive", type=int, default=SERVICE_KEEPALIVE_SECONDS,
+                        help="seconds an idle keep-alive connection is held open")
+    args = parser.parse_args(argv)
+    import uvicorn
+    uvicorn.run(create_app(args.max_concurrent_requests), host=args.host, port=args.port,
+                timeout_keep_alive=args.keepalive)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from .merge import collection_date, normalize_patient, normalize_test_name
+from .parsing import parse_value_with_units
+
+DEFAULT_DB_PATH = os.getenv(
+    "RESULTS_DB_PATH",
+    os.path.join(os.path.expanduser("~"), ".local", "share", "medical-report-parser", "results.db")
+)
+
+RESULTS_STORE_ENABLED = os.getenv("RESULTS_STORE", "1") == "1"
+
+SeriesPoint = namedtuple("SeriesPoint", ["collection_date", "value", "numeric_value", "unit", "reference_range",
+                                         "report_id"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    id INTEGER PRIMARY KEY,
+    patient_key TEXT NOT NULL UNIQUE,
+    name TEXT,
+    age TEXT,
+    sex TEXT
+);
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    patient_id INTEGER NOT NULL REFERENCES patients(id),
+    content_hash TEXT NOT NULL UNIQUE,
+    report_type TEXT,
+    collection_date TEXT,
+    source TEXT,
+    created_at TEXT NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS test_results (
+    id INTEGER PRIMARY KEY,
+    report_id INTEGER NOT NULL REFERENCES reports(id),
+    patient_id INTEGER NOT NULL REFERENCES patients(id),
+    test_key TEXT NOT NULL,
+    test_name TEXT,
+    value TEXT,
+    numeric_value REAL,
+    unit TEXT,
+    reference_range TEXT,
+    collection_date TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_reports_patient ON reports(patient_id, collection_date);
+CREATE INDEX IF NOT EXISTS idx_results_series ON test_results(patient_id, test_key, collection_date);
+CREATE INDEX IF NOT EXISTS idx_results_test ON test_results(test_key);
+"""
+
+def _text(value):
+    return None if value in (None, "") else str(value)
+
+def _sha256(payload):
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def content_hash(report):
+    # the extraction metadata says how a report was read (table, LLM, reused near-duplicate), not
+    # what it contains, so a copy hashes the same however it was extracted
+    content = {key: value for key, value in report.items() if key != "extraction"}
+    return _sha256(json.dumps(content, sort_keys=True, ensure_ascii=False))
+
+class ResultsStore:
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._memory_connection = sqlite3.connect(path) if path == ":memory:" else None
+        with self._transaction() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        if self._memory_connection is not None:
+            return self._memory_connection
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            if conn is not self._memory_connection:
+                conn.close()
+
+    def _patient_id(self, conn, patient_info):
+        key = normalize_patient(patient_info)
+        patient_info = patient_info or {}
+        conn.execute(
+            "INSERT INTO patients (patient_key, name, age, sex) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(patient_key) DO UPDATE SET "
+            "name = COALESCE(patients.name, excluded.name), "
+            "age = COALESCE(excluded.age, patients.age), "
+            "sex = COALESCE(patients.sex, excluded.sex)",
+            (key, _text(patient_info.get("name")), _text(patient_info.get("age")), _text(patient_info.get("sex")))
+        )
+        return conn.execute("SELECT id FROM patients WHERE patient_key = ?", (key,)).fetchone()[0]
+
+    def save_reports(self, reports, source=None):
+        saved = []
+        created_at = datetime.now(timezone.utc).isoformat()
+        with self._transaction() as conn:
+            for report in reports:
+                if not report:
+                    continue
+                payload = json.dumps(report, sort_keys=True, ensure_ascii=False)
+                report_hash = content_hash(report)
+                # rows stored before the extraction metadata was left out were hashed over the whole payload
+                if conn.execute("SELECT 1 FROM reports WHERE content_hash IN (?, ?)",
+                                (report_hash, _sha256(payload))).fetchone():
+                    continue
+                patient_id = self._patient_id(conn, report.get("patient_info"))
+                date = collection_date(report)
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO reports "
+                    "(patient_id, content_hash, report_type, collection_date, source, created_at, payload) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (patient_id, report_hash, _text(report.get("report_type")), date or None, source, created_at,
+                     payload)
+                )
+                if cursor.rowcount == 0:
+                    # the same extraction was already stored by an earlier upload
+                    continue
+                report_id = cursor.lastrowid
+                rows = []
+                for test in report.get("test_results") or []:
+                    test_key = normalize_test_name(test.get("test_name"))
+                    if not test_key:
+                        continue
+                    value = _text(test.get("value"))
+                    rows.append((
+                        report_id, patient_id, test_key, _text(test.get("test_name")), value,
+                        parse_value_with_units(value) if value else None, _text(test.get("unit")),
+                        _text(test.get("reference_range")), date or None
+                    ))
+                conn.executemany(
+                    "INSERT INTO test_results (report_id, patient_id, test_key, test_name, value, numeric_value, "
+                    "unit, reference_range, collection_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                saved.append(report_id)
+        return saved
+
+    def get_test_series(self, patient, test_name):
+        key = normalize_patient(patient if isinstance(patient, dict) else {"name": patient})
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT t.collection_date, t.value, t.numeric_value, t.unit, t.reference_range, t.report_id "
+                "FROM test_results t JOIN patients p ON p.id = t.patient_id "
+                "WHERE p.patient_key = ? AND t.test_key = ? "
+                "ORDER BY t.collection_date IS NULL, t.collection_date, t.report_id",
+                (key, normalize_test_name(test_name))
+            ).fetchall()
+        return [SeriesPoint(*row) for row in rows]
+
+    def list_patients(self):
+        with self._transaction() as conn:
+            return conn.execute("SELECT name, age, sex FROM patients ORDER BY name").fetchall()
+
+    def list_tests(self, patient):
+        key = normalize_patient(patient if isinstance(patient, dict) else {"name": patient})
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT t.test_name FROM test_results t JOIN patients p ON p.id = t.patient_id "
+                "WHERE p.patient_key = ? GROUP BY t.test_key ORDER BY t.test_key",
+                (key,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+_lock = threading.Lock()
+_results_store = None
+
+def get_results_store():
+    global _results_store
+    with _lock:
+        if _results_store is None:
+            _results_store = ResultsStore()
+        return _results_store
@@ -0,0 +1,187 @@
+import json
+from collections import namedtuple
+
+StreamEvent = namedtuple("StreamEvent", ["kind", "report_index", "key", "value"])
+
+WHITESPACE = " \t\r\n"
+
+def is_report_list(value):
+    return isinstance(value, list) and bool(value) and all(isinstance(report, dict) for report in value)
+
+class _Frame:
+    __slots__ = ("kind", "start", "key", "expecting_key", "report_index", "items")
+
+    def __init__(self, kind, start, key, report_index=None):
+        self.kind = kind
+        self.start = start
+        # key of this container in its parent (field name or array position)
+        self.key = key
+        self.expecting_key = kind == "object"
+        self.report_index = report_index
+        self.items = 0
+
+# reports are the top-level object or the objects of a top-level array; completed report
+# fields, test_results entries and whole reports are returned from feed() as they close
+class IncrementalReportParser:
+    def __init__(self):
+        self.buffer = []
+        self.reports = []
+        self._offset = 0
+        self._stack = []
+        self._pending_key = None
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._scalar_start = None
+        self._done = False
+        self._result = None
+        self._root_reports = 0
+
+    def feed(self, chunk):
+        events = []
+        if not chunk:
+            return events
+        base = self._offset
+        self.buffer.append(chunk)
+        self._offset += len(chunk)
+        # the joined text is only needed when a value completes, so it is built lazily
+        text = None
+        for position, char in enumerate(chunk, base):
+            if self._done:
+                break
+            if not self._stack and char not in "{[":
+                # skip anything the model writes before the JSON, such as a ``` fence
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    text = text or "".join(self.buffer)
+                    self._string_done(text, self._string_start, position + 1, events)
+                continue
+            if self._scalar_start is not None and (char in WHITESPACE or char in ",}]"):
+                text = text or "".join(self.buffer)
+                start, self._scalar_start = self._scalar_start, None
+                self._value_done(text[start:position], events)
+            if char in WHITESPACE or char == ":":
+                continue
+            if char == '"':
+                self._in_string = True
+                self._string_start = position
+            elif char in "{[":
+                self._open(char, position)
+            elif char in "}]":
+                text = text or "".join(self.buffer)
+                self._close(text, position, events)
+            elif char == ",":
+                if self._stack and self._stack[-1].kind == "object":
+                    self._stack[-1].expecting_key = True
+            elif self._scalar_start is None:
+                self._scalar_start = position
+        return events
+
+    def _child_key(self):
+        if not self._stack:
+            return None
+        parent = self._stack[-1]
+        if parent.kind == "array":
+            return parent.items
+        return self._pending_key
+
+    def _is_report_level(self):
+        # a new object here is a report: the root, or a direct child of a root array
+        return not self._stack or (len(self._stack) == 1 and self._stack[0].kind == "array")
+
+    def _open(self, char, position):
+        key = self._child_key()
+        report_index = None
+        if not self._stack:
+            self._root_reports = len(self.reports)
+        if char == "{" and self._is_report_level():
+            report_index = len(self.reports)
+            self.reports.append({})
+        self._stack.append(_Frame("object" if char == "{" else "array", position, key, report_index))
+
+    def _close(self, text, position, events):
+        if not self._stack:
+            return
+        frame = self._stack.pop()
+        raw = text[frame.start:position + 1]
+        if not self._stack:
+            try:
+                result = json.loads(raw)
+            except ValueError:
+                result = None
+            if not (isinstance(result, dict) or is_report_list(result)):
+                # a bracket in the text before the answer ("the report [JSON format]:", "ref [1]")
+                # is not the answer; drop what was collected inside it and keep scanning
+                del self.reports[self._root_reports:]
+                self._pending_key = None
+                return
+            self._done = True
+            self._result = result
+        if frame.report_index is not None:
+            try:
+                report = json.loads(raw)
+            except ValueError:
+                report = self.reports[frame.report_index]
+            self.reports[frame.report_index] = report
+            events.append(StreamEvent("report", frame.report_index, None, report))
+            if self._stack:
+                self._stack[-1].items += 1
+            return
+        self._value_done(raw, events, frame.key)
+
+    def _string_done(self, text, start, end, events):
+        parent = self._stack[-1] if self._stack else None
+        if parent is not None and parent.kind == "object" and parent.expecting_key:
+            self._pending_key = json.loads(text[start:end])
+            parent.expecting_key = False
+            return
+        self._value_done(text[start:end], events)
+
+    def _value_done(self, raw, events, key=None):
+        if not self._stack:
+            return
+        parent = self._stack[-1]
+        if key is None:
+            key = self._child_key()
+        if parent.kind == "array":
+            parent.items += 1
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return
+        if parent.report_index is not None:
+            self.reports[parent.report_index][key] = value
+            events.append(StreamEvent("field", parent.report_index, key, value))
+            return
+        grandparent = self._stack[-2] if len(self._stack) > 1 else None
+        if parent.kind == "array" and parent.key == "test_results" and grandparent is not None \
+                and grandparent.report_index is not None and isinstance(value, dict):
+            report = self.reports[grandparent.report_index]
+            report.setdefault("test_results", []).append(value)
+            events.append(StreamEvent("test_result", grandparent.report_index, key, value))
+
+    @property
+    def complete(self):
+        return self._done
+
+    def finish(self):
+        if self._result is not None:
+            return self._result if isinstance(self._result, list) else [self._result]
+        # a truncated stream keeps every field and test result that was already closed
+        return [report for report in self.reports if report]
+
+def replay_events(reports):
+    # the same events a stream would have produced, for results that did not come from one
+    for index, report in enumerate(reports):
+        for key, value in report.items():
+            if key == "test_results" and isinstance(value, list):
+                for position, test in enumerate(value):
+                    yield StreamEvent("test_result", index, position, test)
+            yield StreamEvent("field", index, key, value)
+        yield StreamEvent("report", index, None, report)
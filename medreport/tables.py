@@ -0,0 +1,146 @@
+import os
+import re
+from collections import namedtuple
+
+from .classify import get_report_type
+from .parsing import parse_range, parse_value_with_units
+
+MIN_CONFIDENCE = float(os.getenv("TABLE_FAST_PATH_MIN_CONFIDENCE", "0.85"))
+MIN_RECORDS = 3
+
+TableExtraction = namedtuple("TableExtraction", ["report", "confidence"])
+
+HEADER_SYNONYMS = {
+    "test_name": ["test name", "test", "parameter", "investigation", "analyte", "description", "examination"],
+    "value": ["result", "results", "value", "observed value", "your value", "patient value"],
+    "unit": ["unit", "units", "uom"],
+    "reference_range": ["reference range", "ref range", "ref. range", "normal range", "reference interval",
+                        "biological reference interval", "bio. ref. interval", "reference", "normal values",
+                        "range"],
+}
+
+REPORT_TYPE_LABELS = {"blood": "Blood Test", "urine": "Urine Test"}
+
+QUALITATIVE_VALUES = re.compile(
+    r'^(negative|positive|trace|nil|none|absent|present|normal|not seen|clear|turbid|cloudy|hazy|'
+    r'few|occasional|moderate|many|reactive|non[- ]reactive|[1-4]\+|[a-z ]*yellow|straw|amber)$'
+)
+VALUE_WITH_UNIT = re.compile(r'^\s*([<>]?\s*\d[\d,]*\.?\d*)\s*([^\d\s].*)?$')
+TITLE_LINE = re.compile(r'(?i)\b(report|test|panel|profile|count|analysis|examination)\b')
+PATIENT_FIELDS = {
+    "name": re.compile(r'(?im)^\s*(?:patient\s*name|name)\s*[:\-]\s*([^\n]+?)(?:\s{2,}|\s+(?:age|sex|gender)\b|$)'),
+    "age": re.compile(r'(?i)\bage\s*[:\-]?\s*(\d{1,3})'),
+    "sex": re.compile(r'(?i)\b(?:sex|gender)\s*[:\-]?\s*(male|female|m|f)\b'),
+}
+
+def _cell(value):
+    return re.sub(r'\s+', ' ', str(value or "")).strip()
+
+def _header_mapping(row):
+    mapping = {}
+    for index, cell in enumerate(row):
+        label = _cell(cell).lower().rstrip(":")
+        if not label:
+            continue
+        for field, synonyms in HEADER_SYNONYMS.items():
+            if field not in mapping and label in synonyms:
+                mapping[field] = index
+                break
+    if "test_name" in mapping and "value" in mapping:
+        return mapping
+    return None
+
+def _split_value_unit(value):
+    match = VALUE_WITH_UNIT.match(value)
+    if match and match.group(2):
+        return match.group(1).strip(), match.group(2).strip()
+    return value, ""
+
+def _row_is_valid(record):
+    value = record["value"]
+    if parse_value_with_units(value) is not None:
+        if not record["reference_range"]:
+            return True
+        low, high = parse_range(record["reference_range"])
+        return low is not None and high is not None
+    return bool(QUALITATIVE_VALUES.match(value.lower()))
+
+def extract_table_records(tables):
+    records = []
+    scores = []
+    for table in tables:
+        if not table:
+            continue
+        mapping = None
+        for header_index, row in enumerate(table[:3]):
+            mapping = _header_mapping(row)
+            if mapping:
+                break
+        if not mapping:
+            continue
+        header_quality = 1.0 if "reference_range" in mapping else 0.85
+        for row in table[header_index + 1:]:
+            cells = [_cell(c) for c in row]
+            get = lambda field: cells[mapping[field]] if field in mapping and mapping[field] < len(cells) else ""
+            record = {
+                "test_name": get("test_name"),
+                "value": get("value"),
+                "unit": get("unit"),
+                "reference_range": get("reference_range"),
+            }
+            if not record["test_name"] and not record["value"]:
+                continue
+            if record["test_name"] and not record["value"]:
+                # section headings inside a panel ("DIFFERENTIAL COUNT") carry no result
+                if not any(cells[i] for i in range(len(cells)) if i != mapping["test_name"]):
+                    continue
+            if "unit" not in mapping:
+                record["value"], record["unit"] = _split_value_unit(record["value"])
+            records.append(record)
+            scores.append(header_quality if record["test_name"] and _row_is_valid(record) else 0.0)
+    confidence = sum(scores) / len(scores) if scores else 0.0
+    # one or two matched rows are as likely to be a stray layout table as a lab panel
+    confidence *= min(1.0, len(records) / MIN_RECORDS)
+    return records, confidence
+
+COLLECTION_DATE = re.compile(
+    r'(?i)\b(?:collected(?:\s+on)?|collection\s+date|sample\s+date|date\s+of\s+collection|report\s+date|date)'
+    r'\s*[:\-]?\s*(\d{4}-\d{2}-\d{2}|\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}|\d{1,2}[ -][A-Za-z]{3,9}[ -]\d{4})'
+)
+
+def extract_collection_date(text):
+    match = COLLECTION_DATE.search(text or "")
+    return match.group(1) if match else ""
+
+def extract_patient_info(text):
+    patient_info = {}
+    for field, pattern in PATIENT_FIELDS.items():
+        match = pattern.search(text or "")
+        if not match:
+            continue
+        value = match.group(1).strip()
+        if field == "age":
+            value = int(value)
+        elif field == "sex":
+            value = {"m": "Male", "f": "Female"}.get(value.lower(), value.title())
+        patient_info[field] = value
+    return patient_info
+
+def extract_from_tables(tables, text=""):
+    records, confidence = extract_table_records(tables)
+    report = {
+        "patient_info": extract_patient_info(text),
+        "report_type": "",
+        "collection_date": extract_collection_date(text),
+        "test_results": records,
+        "doctor_notes": "",
+    }
+    # the title decides; test names are shared between panels ("Glucose" is on blood and urine
+    # reports alike), so they are only used when the title says nothing
+    titles = [line for line in (text or "").splitlines()[:15] if TITLE_LINE.search(line)]
+    category = get_report_type({"report_type": " ".join(titles), "test_results": []})
+    if category not in REPORT_TYPE_LABELS:
+        category = get_report_type(report)
+    report["report_type"] = REPORT_TYPE_LABELS.get(category, "Lab Report")
+    report["extraction"] = {"method": "table", "confidence": round(confidence, 3)}
+    return TableExtraction(report, confidence)
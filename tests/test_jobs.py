@@ -0,0 +1,28 @@
+import time
+
+from benchmarks.corpus import build_report
+from medreport.jobs import JobQueue, WorkerPool
+
+def test_job_with_pooled_page_count(tmp_path, monkeypatch):
+    # workers are daemon processes, so a file long enough for the page pool must not try to start one
+    monkeypatch.setenv("LLM_BACKEND", "local")
+    monkeypatch.setenv("PDF_POOL_PROCESSES", "2")
+    monkeypatch.setenv("PDF_POOL_MIN_PAGES", "24")
+    monkeypatch.setenv("REPORT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("SIMILARITY_DB_PATH", str(tmp_path / "similarity.db"))
+    monkeypatch.setenv("RESULTS_STORE", "0")
+    path = tmp_path / "long.pdf"
+    build_report(str(path), "blood", 30)
+    queue = JobQueue(str(tmp_path / "jobs.db"), str(tmp_path / "jobs"))
+    job_id = queue.submit([str(path)])
+    pool = WorkerPool(1, queue.path, queue.jobs_dir).start()
+    try:
+        deadline = time.monotonic() + 120
+        while queue.status(job_id)["status"] not in ("done", "failed"):
+            assert time.monotonic() < deadline
+            time.sleep(0.2)
+    finally:
+        pool.stop()
+    result = queue.result(job_id)
+    assert result["status"] == "done", result["error"]
+    assert not result["files"][0]["failed"], result["files"][0]["messages"]
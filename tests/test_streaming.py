@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from medreport import llm
+from medreport.backends import LocalBackend
+from medreport.cache import ExtractionCache
+from medreport.streaming import IncrementalReportParser
+
+REPORT = {"patient_info": {"name": "A"}, "report_type": "CBC", "test_results": [{"test_name": "Hb", "value": "13.5"}]}
+
+def parse(text, chunk_size=3):
+    parser = IncrementalReportParser()
+    for start in range(0, len(text), chunk_size):
+        parser.feed(text[start:start + chunk_size])
+    return parser
+
+@pytest.mark.parametrize("preamble", ["[1]", "[]", '["x"]', "[JSON format]"])
+def test_preamble_brackets_are_not_the_answer(preamble):
+    parser = parse(f"Values are per ref {preamble}. {json.dumps(REPORT)}")
+    assert parser.complete
+    assert parser.finish() == [REPORT]
+
+def test_preamble_without_report_is_incomplete():
+    parser = parse("Values are per ref [1].")
+    assert not parser.complete
+    assert parser.finish() == []
+
+def test_stream_falls_back_and_never_caches_preamble(tmp_path, monkeypatch):
+    answers = [f"Values are per ref [1]. {json.dumps(REPORT)}", "Values are per ref [1].", json.dumps(REPORT)]
+    backend = LocalBackend(lambda system_prompt, user_prompt, model: answers.pop(0))
+    cache = ExtractionCache(str(tmp_path))
+    monkeypatch.setattr(llm, "get_backend", lambda: backend)
+    monkeypatch.setattr(llm, "get_extraction_cache", lambda: cache)
+    assert llm.stream_report_text("first report", lambda event: None) == [REPORT]
+    # a stream without a report is asked again without streaming
+    assert llm.stream_report_text("second report", lambda event: None) == [REPORT]
+    assert backend.calls == 3
+    for text in ("first report", "second report"):
+        assert cache.get(llm.make_cache_key(text, llm.SYSTEM_PROMPT, llm.MODEL_NAME)) == [REPORT]